@@ -1,167 +1,592 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
-import mysql.connector
-from mysql.connector import Error
-import bcrypt
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, make_response, send_file, g
+from mysql.connector import Error, IntegrityError, errorcode
+import click
+import hashlib
+import json
 import os
 import random
-import re
+import tempfile
+import threading
+import time
 from functools import wraps
-from urllib.parse import urlparse
+from itertools import accumulate
+from uuid import uuid4
 from datetime import datetime
+from db_pool import ConnectionPool
+from storage import open_backend
+from jobs import JobQueue
+from metrics import Metrics
+import querylog
+from profiler import PROFILE_SAMPLE_RATE, PROFILE_TOKEN_TTL, SamplingProfiler, list_profiles, profile_path, profile_token, save as save_profile, valid_token
+from timetable import DAY_NAMES, Week, student_week, course_bitmap, find_conflict, forget_course, note_registration, note_drop
+from passwords import HashingBusy, hash_password, check_password, needs_rehash, bulk_hasher, hash_many
+from grade_upload import SEMESTERS, read_grade_rows, clean_grade_row, resolve_ids
+from student_import import STUDENT_COLUMNS, validate_phone_number, read_batches, clean_row, split_duplicates
+from helpdesk import get_helpdesk
+from gpa import DEANS_LIST_GPA, DEANS_LIST_MIN_CREDITS, PROBATION_GPA, deans_list, probation_list, student_summary, recompute as recompute_gpa, refresh_term as refresh_term_gpa
+from migrations import HOT_QUERIES, full_scans, migrate, pending_migrations
+from transcripts import TRANSCRIPT_PROCESSES, grades_changed, load_cohort, load_student, pregenerate, transcript_key, transcript_path
+from catalog import CATALOG, CATALOG_JSON, CATALOG_VERSION, FACULTY_MAJORS, get_majors_by_faculty
 
 app = Flask(__name__)
 
 # Security: Use environment variables
 app.secret_key = os.environ.get('SECRET_KEY', os.urandom(24))
 
-# Database configuration from environment variables
-mysql_url = os.environ.get('MYSQL_URL')
-url_parts = urlparse(mysql_url)
-db_config = {
-    'host': url_parts.hostname,
-    'user': url_parts.username,
-    'password': url_parts.password,
-    'database': url_parts.path[1:],
-    'port': url_parts.port or 3306
-}
+# Database from DATABASE_URL or MYSQL_URL; a sqlite:/// URL selects the embedded engine for offline runs
+storage = open_backend()
+db_config = storage.db_config
+
+# One pool per gunicorn worker process; keep workers * DB_POOL_SIZE below max_connections
+db_pool = ConnectionPool(
+    storage.connect,
+    size=int(os.environ.get('DB_POOL_SIZE', 5)),
+    timeout=float(os.environ.get('DB_POOL_TIMEOUT', 5)),
+    validate_after=float(os.environ.get('DB_POOL_VALIDATE_AFTER', 1))
+)
+
+# Semester used for new course registrations
+CURRENT_SEMESTER = 'Fall 2024'
+
+# Row counts shown on the admin dashboard, kept in the counters table
+COUNTED_TABLES = ['students', 'courses', 'announcements', 'registrations']
+# Each counter is spread over this many rows so concurrent writers rarely lock the same one
+COUNTER_SHARDS = int(os.environ.get('COUNTER_SHARDS', 16))
+
+def bump_counter(cursor, name, delta):
+    """Adjust a counter inside the caller's transaction"""
+    if delta:
+        cursor.execute(
+            "INSERT INTO counters (name, shard, value) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE value = value + VALUES(value)",
+            (name, random.randrange(COUNTER_SHARDS), delta)
+        )
+
+# Per-worker request and pool metrics, served to Prometheus from /metrics
+metrics = Metrics()
+# Addresses allowed to scrape /metrics
+METRICS_ALLOWED_ADDRS = set(os.environ.get('METRICS_ALLOWED_ADDRS', '127.0.0.1,::1').split(','))
+# Add X-SQL-* headers with each response's statement counts and timings
+SQL_DEBUG_HEADERS = os.environ.get('SQL_DEBUG_HEADERS', '').lower() in ('1', 'true', 'yes')
+# Signs X-Profile-Token headers; with neither it nor SECRET_KEY set, no tokens are issued or accepted
+PROFILE_SECRET = os.environ.get('PROFILE_SECRET') or os.environ.get('SECRET_KEY')
+
+@metrics.collector
+def collect_pool_stats(metrics):
+    stats = db_pool.stats()
+    for state in ('in_use', 'idle'):
+        metrics.set('portal_db_pool_connections', (('state', state),), stats[state])
 
 def get_db_connection():
+    started = time.perf_counter()
     try:
-        connection = mysql.connector.connect(**db_config)
+        connection = db_pool.get_connection()
+        metrics.connection_acquired(time.perf_counter() - started)
         return connection
     except Error as e:
-        print(f"Error connecting to MySQL: {e}")
+        metrics.connection_acquired(time.perf_counter() - started, ok=False)
+        print(f"Error connecting to the database: {e}")
         return None
 
-def hash_password(password):
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-
-def check_password(password, hashed):
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
-
-def validate_phone_number(phone):
-    """Validate phone number format"""
-    pattern = r'^\+?1?\d{9,15}$'
-    return re.match(pattern, phone) is not None
-
-def get_majors_by_faculty(faculty):
-    """Get majors based on selected faculty"""
-    faculty_majors = {
-        'FCIT': ['Computer Science', 'Information Technology', 'Software Engineering', 
-                'Cybersecurity', 'Data Science', 'Artificial Intelligence', 
-                'Computer Engineering', 'Network Engineering'],
-        'FBBA': ['Business Administration', 'Accounting', 'Finance', 'Marketing', 
-                'Human Resources', 'International Business', 'Management', 'Entrepreneurship'],
-        'FENG': ['Electrical Engineering', 'Mechanical Engineering', 'Civil Engineering', 
-                'Chemical Engineering', 'Industrial Engineering', 'Biomedical Engineering'],
-        'FMED': ['Nursing', 'midwifery', 'Pharmacy', 'Nutrition', 'Public Health', 'Medical laborotary'],
-        'FSCI': ['Social work', 'Public administration', 'International relationship', 'Development study', 'Political science'],
-        'FART': ['Psychology', 'Sociology', 'English Literature', 'History', 
-                'Political Science', 'International Relations'],
-        'FLAW': ['Law', 'Criminal Justice'],
-        'FEDU': ['Education', 'Early Childhood Education']
-    }
-    return faculty_majors.get(faculty, [])
+# Post-registration work runs on background threads instead of inside the request
+job_queue = JobQueue(
+    get_db_connection,
+    workers=int(os.environ.get('JOB_WORKERS', 2)),
+    max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+)
 
-def assign_sample_grades(student_id):
-    """Assign random sample grades to a new student"""
+# Migrations run as a deploy step (flask migrate, see Procfile and railway.json),
+# never inside a web request; until they have, requests are answered with a 503
+schema_ready = False
+
+def migrate_schema():
+    """Apply pending migrations; for the deploy step, the development server and bench.seed"""
+    connection = get_db_connection()
+    if not connection:
+        raise Error(msg='Database connection error')
+    try:
+        return migrate(connection)
+    finally:
+        connection.close()
+
+def check_schema():
+    """Whether every migration has been applied; once true, it is not checked again"""
+    global schema_ready
+    if schema_ready:
+        return True
     connection = get_db_connection()
     if connection:
         try:
-            cursor = connection.cursor()
-            
-            # Get some random courses to assign grades for
-            cursor.execute("SELECT id FROM courses ORDER BY RAND() LIMIT 6")
-            courses = cursor.fetchall()
-            
-            # Grade distribution with probabilities
-            grade_distribution = [
-                ('A', 0.2),   # 20% chance
-                ('A-', 0.15), # 15% chance  
-                ('B+', 0.15), # 15% chance
-                ('B', 0.15),  # 15% chance
-                ('B-', 0.1),  # 10% chance
-                ('C+', 0.1),  # 10% chance
-                ('C', 0.08),  # 8% chance
-                ('C-', 0.05), # 5% chance
-                ('D', 0.02)   # 2% chance
-            ]
-            
-            semesters = ['Fall', 'Spring']
-            years = ['2023', '2024']
-            
-            for course in courses:
-                course_id = course[0]
-                
-                # Random grade based on distribution
-                rand_val = random.random()
-                cumulative_prob = 0
-                assigned_grade = 'B'  # default
-                
-                for grade, prob in grade_distribution:
-                    cumulative_prob += prob
-                    if rand_val <= cumulative_prob:
-                        assigned_grade = grade
-                        break
-                
-                # Random semester and year
-                semester = random.choice(semesters)
-                year = random.choice(years)
-                
-                # Insert the grade
-                cursor.execute(
-                    "INSERT INTO grades (student_id, course_id, grade, semester, academic_year) VALUES (%s, %s, %s, %s, %s)",
-                    (student_id, course_id, assigned_grade, semester, year)
-                )
-            
-            connection.commit()
-            print(f"Assigned sample grades for student {student_id}")
-            
+            pending = pending_migrations(connection.cursor())
+            if pending:
+                print(f"Database schema has {len(pending)} pending migration(s); run flask migrate")
+            else:
+                schema_ready = True
         except Error as e:
-            print(f"Error assigning grades: {e}")
+            print(f"Error checking database schema: {e}")
         finally:
             connection.close()
+    return schema_ready
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_endpoint = request.endpoint or 'unmatched'
+    g.metrics_started = time.perf_counter()
+    metrics.request_started(g.metrics_endpoint)
+    g.query_log = querylog.start(g.metrics_endpoint)
+
+@app.after_request
+def note_response_status(response):
+    g.metrics_status = response.status_code
+    if (SQL_DEBUG_HEADERS or app.debug) and 'query_log' in g:
+        log = g.query_log
+        response.headers['X-SQL-Queries'] = str(log.count)
+        response.headers['X-SQL-Time'] = f'{log.seconds * 1000:.1f}ms'
+        repeated = log.repeated()
+        if repeated:
+            shape, (times, _, _) = next(iter(repeated.items()))
+            response.headers['X-SQL-Repeated'] = f'{times}x {shape[:200]}'.encode('ascii', 'replace').decode('ascii')
+    return response
+
+def profile_requested():
+    """Whether to profile this request: an admin asking, a valid signed header, or the sample rate"""
+    if request.args.get('_profile') or request.headers.get('X-Profile'):
+        if 'admin_id' in session:
+            return True
+    token = request.headers.get('X-Profile-Token')
+    if token and valid_token(PROFILE_SECRET, request.path, token):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+@app.before_request
+def start_profiling():
+    if profile_requested():
+        g.profiler = SamplingProfiler().start()
+
+@app.after_request
+def finish_profiling(response):
+    profiler = g.pop('profiler', None)
+    if profiler:
+        try:
+            profile_id = save_profile(profiler.stop(), {
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+            }, g.get('query_log'))
+            response.headers['X-Profile-Id'] = profile_id
+        except OSError as e:
+            print(f"Error saving profile: {e}")
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if 'metrics_started' in g:
+        log = querylog.finish()
+        if log is not None:
+            metrics.request_queries(g.metrics_endpoint, log)
+        # No status means the request died with an unhandled exception
+        metrics.request_finished(g.metrics_endpoint, request.method, g.get('metrics_status', 500),
+                                 time.perf_counter() - g.metrics_started)
+
+@app.before_request
+def start_background_services():
+    if request.endpoint in ('static', 'prometheus_metrics'):
+        return None
+    if not check_schema():
+        response = make_response('The portal is being updated. Please try again in a minute.', 503)
+        response.headers['Retry-After'] = '30'
+        return response
+    job_queue.start()
+
+@app.errorhandler(HashingBusy)
+def hashing_busy(e):
+    """Too many logins are hashing at once; ask the user to retry instead of queueing forever"""
+    flash('The portal is very busy right now. Please try again in a moment.', 'error')
+    response = redirect(request.path)
+    response.headers['Retry-After'] = '5'
+    return response
+
+# Grade distribution with probabilities
+GRADE_DISTRIBUTION = [
+    ('A', 0.2),   # 20% chance
+    ('A-', 0.15), # 15% chance
+    ('B+', 0.15), # 15% chance
+    ('B', 0.15),  # 15% chance
+    ('B-', 0.1),  # 10% chance
+    ('C+', 0.1),  # 10% chance
+    ('C', 0.08),  # 8% chance
+    ('C-', 0.05), # 5% chance
+    ('D', 0.02)   # 2% chance
+]
+SAMPLE_GRADES = [grade for grade, _ in GRADE_DISTRIBUTION]
+SAMPLE_GRADE_CUM_WEIGHTS = list(accumulate(prob for _, prob in GRADE_DISTRIBUTION))
+
+def random_course_ids(cursor, count):
+    """Pick up to count distinct random course ids without ORDER BY RAND().
+
+    Each pick is a primary-key seek to the first id at or above a random
+    point in the id range, so the cost does not grow with the catalog.
+    """
+    cursor.execute("SELECT MIN(id), MAX(id) FROM courses")
+    low, high = cursor.fetchone()
+    if low is None:
+        return []
+
+    # Oversample so that picks landing on the same course still leave enough
+    picks = [random.randint(low, high) for _ in range(count * 2)]
+    cursor.execute(
+        # Scalar subqueries, because SQLite does not take parenthesized UNION members
+        " UNION ".join(["SELECT (SELECT id FROM courses WHERE id >= %s ORDER BY id LIMIT 1)"] * len(picks)),
+        picks
+    )
+    course_ids = [row[0] for row in cursor.fetchall()]
+    random.shuffle(course_ids)
+    return course_ids[:count]
+
+# Inserts a grade, or replaces the one already held for that student, course and term
+UPSERT_GRADE = (
+    "INSERT INTO grades (student_id, course_id, grade, semester, academic_year) VALUES (%s, %s, %s, %s, %s) "
+    "ON DUPLICATE KEY UPDATE grade = VALUES(grade), assigned_at = CURRENT_TIMESTAMP"
+)
+
+def upsert_grades(cursor, rows):
+    """Write (student_id, course_id, grade, semester, academic_year) rows as one multi-row upsert.
+
+    The GPA aggregates of every student in rows are rebuilt in the same
+    transaction, set-based, and their cached transcripts go stale.
+    """
+    if rows:
+        cursor.executemany(UPSERT_GRADE, rows)
+        student_ids = sorted({row[0] for row in rows})
+        recompute_gpa(cursor, student_ids=student_ids)
+        grades_changed(cursor, student_ids)
+    return len(rows)
+
+@job_queue.handler('assign_sample_grades')
+def assign_sample_grades(student_id):
+    """Assign random sample grades to a new student"""
+    connection = get_db_connection()
+    if not connection:
+        raise Error(msg='Database connection error')
+    try:
+        cursor = connection.cursor()
+        
+        # Get some random courses to assign grades for
+        course_ids = random_course_ids(cursor, 6)
+        grades = random.choices(SAMPLE_GRADES, cum_weights=SAMPLE_GRADE_CUM_WEIGHTS, k=len(course_ids))
+        
+        rows = [
+            (student_id, course_id, grade, random.choice(['Fall', 'Spring']), random.choice(['2023', '2024']))
+            for course_id, grade in zip(course_ids, grades)
+        ]
+        upsert_grades(cursor, rows)
+        
+        connection.commit()
+        print(f"Assigned sample grades for student {student_id}")
+        
+    except Error as e:
+        print(f"Error assigning grades: {e}")
+        raise
+    finally:
+        connection.close()
+
+def generate_grade_history(student_id, enrollment_year, course_ids, until_year):
+    """Build grade rows for every term from enrollment to until_year.
+
+    Each student gets a fixed ability offset so their grades stay correlated
+    from term to term, as real transcripts do.
+    """
+    ability = round(random.gauss(0, 1.2))
+    available = list(course_ids)
+    random.shuffle(available)
+    rows = []
+    terms = [('Fall', enrollment_year)]
+    for year in range(enrollment_year + 1, until_year + 1):
+        terms += [('Spring', year), ('Fall', year)]
+
+    for semester, year in terms:
+        take = random.randint(4, 6)
+        term_courses, available = available[:take], available[take:]
+        if not term_courses:
+            break
+        for course_id, grade in zip(term_courses, random.choices(SAMPLE_GRADES, cum_weights=SAMPLE_GRADE_CUM_WEIGHTS, k=len(term_courses))):
+            index = min(max(SAMPLE_GRADES.index(grade) - ability, 0), len(SAMPLE_GRADES) - 1)
+            rows.append((student_id, course_id, SAMPLE_GRADES[index], semester, str(year)))
+    return rows
 
+def seed_grade_histories(limit, batch_size=1000):
+    """Generate grade histories for up to limit students that have no grades yet"""
+    connection = get_db_connection()
+    if not connection:
+        raise Error(msg='Database connection error')
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT id FROM courses")
+        course_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT s.id, s.enrollment_year FROM students s WHERE NOT EXISTS (SELECT 1 FROM grades g WHERE g.student_id = s.id) LIMIT %s",
+            (limit,)
+        )
+        students = cursor.fetchall()
+
+        this_year = datetime.now().year
+        rows = []
+        inserted = 0
+        for student_id, enrollment_year in students:
+            rows += generate_grade_history(student_id, int(enrollment_year or this_year), course_ids, this_year)
+            if len(rows) >= batch_size:
+                inserted += upsert_grades(cursor, rows)
+                connection.commit()
+                rows = []
+        if rows:
+            inserted += upsert_grades(cursor, rows)
+            connection.commit()
+        return len(students), inserted
+    finally:
+        connection.close()
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Bring the database schema up to date"""
+    connection = get_db_connection()
+    if not connection:
+        raise click.ClickException('Database connection error')
+    try:
+        pending = pending_migrations(connection.cursor())
+        if not pending:
+            click.echo(f"Schema of {storage.describe()} is up to date")
+            return
+        migrate(connection)
+        click.echo(f"Applied {len(pending)} migration(s) to {storage.describe()}")
+    except Error as e:
+        raise click.ClickException(f"Migrating {storage.describe()} failed: {e}")
+    finally:
+        connection.close()
+
+@app.cli.command('check-queries')
+def check_queries_command():
+    """EXPLAIN the hot queries and fail if any of them scans a whole table"""
+    connection = get_db_connection()
+    if not connection:
+        raise click.ClickException('Database connection error')
+    try:
+        scans = full_scans(connection.cursor())
+    finally:
+        connection.close()
+    for name, table in scans:
+        click.echo(f"FULL SCAN: {name} reads all of {table}")
+    if scans:
+        raise click.ClickException(f"{len(scans)} of {len(HOT_QUERIES)} hot queries scan a whole table")
+    click.echo(f"All {len(HOT_QUERIES)} hot queries use an index")
+
+@app.cli.command('seed-grades')
+@click.argument('students', type=int)
+def seed_grades_command(students):
+    """Generate grade histories for STUDENTS students without grades"""
+    started = time.perf_counter()
+    seeded, inserted = seed_grade_histories(students)
+    click.echo(f"Inserted {inserted} grades for {seeded} students in {time.perf_counter() - started:.1f}s")
+
+def enroll_program_courses(cursor, major, student_id=None, enrollment_year=None, student_ids=None, semester=CURRENT_SEMESTER):
+    """Register students of a major for every course of their program.
+
+    Limit to one student with student_id, to a set of students with
+    student_ids or to one cohort with enrollment_year. Runs two statements
+    however many courses or students are involved and returns the number of
+    registrations created.
+    """
+    student_filter = ''
+    params = []
+    if student_id is not None:
+        student_filter += ' AND s.id = %s'
+        params.append(student_id)
+    if student_ids is not None:
+        if not student_ids:
+            return 0
+        student_filter += f" AND s.id IN ({', '.join(['%s'] * len(student_ids))})"
+        params += list(student_ids)
+    if enrollment_year is not None:
+        student_filter += ' AND s.enrollment_year = %s'
+        params.append(enrollment_year)
+
+    # Count the missing registrations per course first; this also locks the
+    # course rows, so it serializes with reserve_seat() on the same courses
+    cursor.execute(
+        f"""UPDATE courses AS c
+        SET current_enrollment = c.current_enrollment + (
+            SELECT COUNT(*) FROM students s
+            WHERE s.major = c.program{student_filter}
+            AND NOT EXISTS (SELECT 1 FROM registrations r WHERE r.student_id = s.id AND r.course_id = c.id)
+        )
+        WHERE c.program = %s""",
+        (*params, major)
+    )
+
+    cursor.execute(
+        f"""INSERT IGNORE INTO registrations (student_id, course_id, semester)
+        SELECT s.id, c.id, %s
+        FROM students s
+        JOIN courses c ON c.program = s.major
+        WHERE s.major = %s{student_filter}
+        AND NOT EXISTS (SELECT 1 FROM registrations r WHERE r.student_id = s.id AND r.course_id = c.id)""",
+        (semester, major, *params)
+    )
+    created = cursor.rowcount
+    bump_counter(cursor, 'registrations', created)
+    return created
+
+@job_queue.handler('assign_program_courses')
 def assign_program_courses(student_id, major):
     """Automatically assign required courses based on student's major"""
     connection = get_db_connection()
-    if connection:
+    if not connection:
+        raise Error(msg='Database connection error')
+    try:
+        cursor = connection.cursor()
+        enroll_program_courses(cursor, major, student_id=student_id)
+        connection.commit()
+        print(f"Automatically assigned program courses for student {student_id} in major {major}")
+        
+    except Error as e:
+        print(f"Error assigning program courses: {e}")
+        raise
+    finally:
+        connection.close()
+
+def enroll_cohort(major, enrollment_year):
+    """Assign program courses to every student of a major and enrollment year in one pass"""
+    connection = get_db_connection()
+    if not connection:
+        raise Error(msg='Database connection error')
+    try:
+        cursor = connection.cursor()
+        created = enroll_program_courses(cursor, major, enrollment_year=enrollment_year)
+        connection.commit()
+        return created
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+@app.cli.command('enroll-cohort')
+@click.argument('major')
+@click.argument('enrollment_year', type=int)
+def enroll_cohort_command(major, enrollment_year):
+    """Register a whole cohort for the courses of its program"""
+    created = enroll_cohort(major, enrollment_year)
+    click.echo(f"Created {created} registrations for {major} students enrolled in {enrollment_year}")
+
+def reserve_seat(connection, student_id, course_id, semester=CURRENT_SEMESTER, retries=3):
+    """Atomically take a seat in a course if one is free and it fits the student's timetable.
+
+    Returns 'registered', 'already_registered', 'clash', 'full' or 'not_found'.
+    """
+    cursor = connection.cursor()
+    for attempt in range(retries + 1):
         try:
-            cursor = connection.cursor()
-            
-            # Get required courses for the student's major
-            cursor.execute("SELECT id FROM courses WHERE program = %s", (major,))
-            required_courses = cursor.fetchall()
-            
-            # Register student for required courses
-            for course in required_courses:
-                course_id = course[0]
-                
-                # Check if already registered
+            # Claim the seat first: the conditional UPDATE takes the row lock on
+            # the course and enforces capacity in the same statement
+            cursor.execute(
+                "UPDATE courses SET current_enrollment = current_enrollment + 1 WHERE id = %s AND current_enrollment < max_capacity",
+                (course_id,)
+            )
+            if cursor.rowcount != 1:
+                connection.rollback()
                 cursor.execute(
-                    "SELECT * FROM registrations WHERE student_id = %s AND course_id = %s",
-                    (student_id, course_id)
+                    "SELECT (SELECT COUNT(*) FROM courses WHERE id = %s), (SELECT COUNT(*) FROM registrations WHERE student_id = %s AND course_id = %s AND semester = %s)",
+                    (course_id, student_id, course_id, semester)
                 )
-                if not cursor.fetchone():
-                    # Register for course
-                    cursor.execute(
-                        "INSERT INTO registrations (student_id, course_id, semester) VALUES (%s, %s, %s)",
-                        (student_id, course_id, 'Fall 2024')
-                    )
-                    
-                    # Update course enrollment
-                    cursor.execute(
-                        "UPDATE courses SET current_enrollment = current_enrollment + 1 WHERE id = %s",
-                        (course_id,)
-                    )
-            
+                course_exists, already_registered = cursor.fetchone()
+                if already_registered:
+                    return 'already_registered'
+                return 'full' if course_exists else 'not_found'
+
+            # Lock the student so their other registrations queue up behind this
+            # one, then check for clashes against what is committed now
+            cursor.execute("SELECT id FROM students WHERE id = %s FOR UPDATE", (student_id,))
+            cursor.fetchall()
+            if find_conflict(cursor, student_id, course_id, semester):
+                connection.rollback()
+                return 'clash'
+
+            # The unique key on registrations rejects duplicates, which rolls the seat back
+            cursor.execute(
+                "INSERT INTO registrations (student_id, course_id, semester) VALUES (%s, %s, %s)",
+                (student_id, course_id, semester)
+            )
+            bump_counter(cursor, 'registrations', 1)
             connection.commit()
-            print(f"Automatically assigned program courses for student {student_id} in major {major}")
-            
+            return 'registered'
+        except IntegrityError as e:
+            connection.rollback()
+            if e.errno == errorcode.ER_DUP_ENTRY:
+                return 'already_registered'
+            raise
         except Error as e:
-            print(f"Error assigning program courses: {e}")
-        finally:
-            connection.close()
+            connection.rollback()
+            if e.errno not in (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT) or attempt == retries:
+                raise
+
+# Announcements change a few times a day, so every worker keeps them in memory.
+# Announcements are only ever added or deleted, and either one changes the
+# table's row count or highest id. Each read compares that pair with the
+# cached one, so a write made through any worker shows up on the next request
+# everywhere, at the cost of one primary-key query.
+announcement_cache = {'version': None, 'rows': None, 'etag': None, 'last_modified': None}
+announcement_cache_lock = threading.Lock()
+
+def get_announcements():
+    """All announcements, newest first, plus an ETag and Last-Modified for them"""
+    connection = get_db_connection()
+    if not connection:
+        raise Error(msg='Database connection error')
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT COUNT(*) AS total, MAX(id) AS newest FROM announcements")
+        row = cursor.fetchone()
+        version = (row['total'], row['newest'])
+        with announcement_cache_lock:
+            if announcement_cache['version'] == version:
+                return announcement_cache['rows'], announcement_cache['etag'], announcement_cache['last_modified']
+        
+        cursor.execute("SELECT * FROM announcements ORDER BY created_at DESC")
+        rows = cursor.fetchall()
+    finally:
+        connection.close()
+    
+    etag = hashlib.sha1(json.dumps(rows, default=str).encode('utf-8')).hexdigest()
+    last_modified = rows[0]['created_at'] if rows else None
+    with announcement_cache_lock:
+        # rows were read after version, so at worst the next request reloads them
+        announcement_cache.update(version=version, rows=rows, etag=etag, last_modified=last_modified)
+    return rows, etag, last_modified
+
+# Pages change with a deploy too, so the template files are part of every page ETag
+TEMPLATE_VERSION = hashlib.sha1(''.join(
+    f"{path}:{os.path.getmtime(os.path.join(root, path))}"
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, 'templates')))
+    for path in sorted(files)
+).encode('utf-8')).hexdigest()
+
+def page_etag(*parts):
+    """ETag for a page built from the given data versions and the logged-in user"""
+    identity = (session.get('student_id'), session.get('student_name'), session.get('admin_id'))
+    return hashlib.sha1(repr((TEMPLATE_VERSION, identity) + parts).encode('utf-8')).hexdigest()
+
+def conditional_response(etag, last_modified, render):
+    """Answer 304 if the browser's copy is current, else render and tag the page"""
+    # A pending flash message has to be rendered, so never short-circuit then
+    if '_flashes' not in session and request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    # Let the browser keep the page but always ask us before reusing it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 # Routes
 @app.route('/')
@@ -228,18 +653,16 @@ def register():
                     "INSERT INTO students (university_id, faculty, first_name, last_name, email, phone_number, password, major, enrollment_year) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
                     (university_id, faculty, first_name, last_name, email, phone_number, hashed_password, major, enrollment_year)
                 )
-                connection.commit()
+                student_db_id = cursor.lastrowid
+                bump_counter(cursor, 'students', 1)
                 
-                # Get the database ID of the new student
-                cursor.execute("SELECT id FROM students WHERE university_id = %s", (university_id,))
-                result = cursor.fetchone()
-                student_db_id = result[0]
-                
-                # Assign sample grades automatically
-                assign_sample_grades(student_db_id)
-                
-                # Automatically assign program courses
-                assign_program_courses(student_db_id, major)
+                # Queue sample grades and program courses in the same transaction as the student
+                job_ids = [
+                    job_queue.enqueue('assign_sample_grades', cursor, student_id=student_db_id),
+                    job_queue.enqueue('assign_program_courses', cursor, student_id=student_db_id, major=major),
+                ]
+                connection.commit()
+                job_queue.dispatch(*job_ids)
                 
                 flash(f'Registration successful! You can now login with your University ID: <strong>{university_id}</strong>', 'success')
                 return redirect(url_for('login'))
@@ -260,11 +683,31 @@ def register():
     
     return render_template('register.html')
 
+@app.context_processor
+def inject_catalog():
+    """Faculty/major catalog for the student forms"""
+    return {'catalog': CATALOG, 'catalog_version': CATALOG_VERSION}
+
+@app.route('/catalog/<version>.json')
+def catalog(version):
+    """The whole faculty/major catalog; a versioned URL never changes, so it is cached for a year"""
+    if version != CATALOG_VERSION:
+        return redirect(url_for('catalog', version=CATALOG_VERSION))
+    
+    response = make_response(CATALOG_JSON)
+    response.mimetype = 'application/json'
+    response.set_etag(CATALOG_VERSION)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response.make_conditional(request)
+
 @app.route('/get_majors/<faculty>')
 def get_majors(faculty):
     """API endpoint to get majors for selected faculty"""
     majors = get_majors_by_faculty(faculty)
-    return jsonify(majors)
+    response = jsonify(majors)
+    response.set_etag(CATALOG_VERSION)
+    response.headers['Cache-Control'] = 'public, max-age=3600'
+    return response.make_conditional(request)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -283,6 +726,14 @@ def login():
                 student = cursor.fetchone()
                 
                 if student and check_password(password, student['password']):
+                    # Upgrade the hash when BCRYPT_ROUNDS has changed since it was made
+                    if needs_rehash(student['password']):
+                        cursor.execute(
+                            "UPDATE students SET password = %s WHERE id = %s",
+                            (hash_password(password), student['id'])
+                        )
+                        connection.commit()
+                    
                     session['student_id'] = student['id']
                     session['student_name'] = f"{student['first_name']} {student['last_name']}"
                     session['student_university_id'] = student['university_id']
@@ -305,45 +756,41 @@ def dashboard():
         return redirect(url_for('login'))
     
     # Get recent announcements
-    connection = get_db_connection()
     announcements = []
+    announcements_etag = None
+    last_modified = None
+    try:
+        all_announcements, announcements_etag, last_modified = get_announcements()
+        announcements = all_announcements[:3]
+    except Error as e:
+        print(f"Error loading announcements: {e}")
     
+    # Build the student's week from their registrations
+    week = Week([])
+    connection = get_db_connection()
     if connection:
         try:
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM announcements ORDER BY created_at DESC LIMIT 3")
-            announcements = cursor.fetchall()
+            week = student_week(connection.cursor(dictionary=True), session['student_id'], CURRENT_SEMESTER)
         except Error as e:
-            print(f"Error loading announcements: {e}")
+            print(f"Error loading timetable: {e}")
         finally:
             connection.close()
     
-    # Static timetable data for today's classes preview
-    static_timetable = [
-        {'day': 'Monday', 'time': '8:00 AM - 9:30 AM', 'course_code': 'CS101', 'course_name': 'Introduction to Programming', 'instructor': 'Dr. Smith', 'room': 'Room 101'},
-        {'day': 'Monday', 'time': '11:30 AM - 1:00 PM', 'course_code': 'MATH201', 'course_name': 'Calculus I', 'instructor': 'Dr. Johnson', 'room': 'Room 202'},
-        {'day': 'Tuesday', 'time': '9:45 AM - 11:15 AM', 'course_code': 'PHY101', 'course_name': 'Physics I', 'instructor': 'Dr. Wilson', 'room': 'Room 305'},
-        {'day': 'Tuesday', 'time': '1:30 PM - 3:00 PM', 'course_code': 'ENG101', 'course_name': 'English Composition', 'instructor': 'Prof. Davis', 'room': 'Room 410'},
-        {'day': 'Wednesday', 'time': '8:00 AM - 9:30 AM', 'course_code': 'CS101', 'course_name': 'Introduction to Programming', 'instructor': 'Dr. Smith', 'room': 'Room 101'},
-        {'day': 'Wednesday', 'time': '11:30 AM - 1:00 PM', 'course_code': 'MATH201', 'course_name': 'Calculus I', 'instructor': 'Dr. Johnson', 'room': 'Room 202'},
-        {'day': 'Thursday', 'time': '9:45 AM - 11:15 AM', 'course_code': 'PHY101', 'course_name': 'Physics I', 'instructor': 'Dr. Wilson', 'room': 'Room 305'},
-        {'day': 'Friday', 'time': '1:30 PM - 3:00 PM', 'course_code': 'ENG101', 'course_name': 'English Composition', 'instructor': 'Prof. Davis', 'room': 'Room 410'}
-    ]
-    
-    # Get current day for today's classes display
-    from datetime import datetime
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-    today_name = days[datetime.now().weekday()]
-    
-    # Filter today's classes
-    todays_classes = [cls for cls in static_timetable if cls['day'] == today_name]
-    
-    return render_template('dashboard.html', 
+    # Today's classes are a direct lookup by weekday
+    weekday = datetime.now().weekday()
+    today_name = DAY_NAMES[weekday]
+    todays_classes = week.on(weekday)
+    
+    return conditional_response(
+        page_etag(announcements_etag, today_name, week.entries),
+        last_modified,
+        lambda: render_template('dashboard.html', 
                          student_name=session['student_name'],
                          announcements=announcements,
                          todays_classes=todays_classes,
                          today_name=today_name,
-                         timetable_data=static_timetable)
+                         timetable_data=week.entries)
+    )
 
 @app.route('/logout')
 def logout():
@@ -412,34 +859,31 @@ def register_course(course_id):
     connection = get_db_connection()
     if connection:
         try:
-            cursor = connection.cursor()
+            result = reserve_seat(connection, session['student_id'], course_id)
             
-            # Check if already registered
-            cursor.execute(
-                "SELECT * FROM registrations WHERE student_id = %s AND course_id = %s",
-                (session['student_id'], course_id)
-            )
-            if cursor.fetchone():
+            if result == 'registered':
+                note_registration(session['student_id'], course_id)
+                flash('Course registration successful!', 'success')
+            elif result == 'clash':
+                # Name the clashing course; only the check inside reserve_seat() decides
+                cursor = connection.cursor()
+                conflict_id = find_conflict(cursor, session['student_id'], course_id, CURRENT_SEMESTER)
+                cursor.execute("SELECT course_code, schedule_days, schedule_time FROM courses WHERE id = %s", (conflict_id,))
+                row = cursor.fetchone()
+                if row:
+                    code, days, times = row
+                    flash(f'This course clashes with {code} ({days} {times}) in your timetable!', 'error')
+                else:
+                    flash('This course clashes with another course in your timetable!', 'error')
+            elif result == 'already_registered':
                 flash('You are already registered for this course!', 'error')
-                return redirect(url_for('courses'))
-            
-            # Register for course
-            cursor.execute(
-                "INSERT INTO registrations (student_id, course_id, semester) VALUES (%s, %s, %s)",
-                (session['student_id'], course_id, 'Fall 2024')
-            )
-            
-            # Update course enrollment
-            cursor.execute(
-                "UPDATE courses SET current_enrollment = current_enrollment + 1 WHERE id = %s",
-                (course_id,)
-            )
-            
-            connection.commit()
-            flash('Course registration successful!', 'success')
+            elif result == 'full':
+                flash('Registration failed! This course is full.', 'error')
+            else:
+                flash('Course not found!', 'error')
             
         except Error as e:
-            flash('Registration failed! Course might be full.', 'error')
+            flash('Registration failed! Please try again.', 'error')
         finally:
             connection.close()
     
@@ -461,11 +905,15 @@ def drop_course(course_id):
                 (session['student_id'], course_id)
             )
             
-            # Update course enrollment
-            cursor.execute(
-                "UPDATE courses SET current_enrollment = current_enrollment - 1 WHERE id = %s",
-                (course_id,)
-            )
+            # Only give the seat back if a registration was actually removed
+            dropped = cursor.rowcount
+            if dropped:
+                note_drop(session['student_id'], course_id)
+                bump_counter(cursor, 'registrations', -dropped)
+                cursor.execute(
+                    "UPDATE courses SET current_enrollment = current_enrollment - 1 WHERE id = %s AND current_enrollment > 0",
+                    (course_id,)
+                )
             
             connection.commit()
             flash('Course dropped successfully!', 'success')
@@ -497,7 +945,10 @@ def grades():
             """, (session['student_id'],))
             grades = cursor.fetchall()
             
-            return render_template('grades.html', grades=grades)
+            # GPA and credits come precomputed from the aggregates
+            gpa_summary, term_gpas = student_summary(cursor, session['student_id'])
+            
+            return render_template('grades.html', grades=grades, gpa_summary=gpa_summary, term_gpas=term_gpas)
         except Error as e:
             flash('Error loading grades!', 'error')
         finally:
@@ -505,22 +956,53 @@ def grades():
     
     return redirect(url_for('dashboard'))
 
+def send_transcript(student_id):
+    """Serve a student's cached transcript, rendering it first if their grades changed"""
+    connection = get_db_connection()
+    if not connection:
+        raise Error(msg='Database connection error')
+    try:
+        cursor = connection.cursor(dictionary=True)
+        student = load_student(cursor, student_id)
+        if not student:
+            return None
+        path = transcript_path(cursor, student)
+    finally:
+        connection.close()
+    
+    # The file name changes with every version, so the key doubles as the ETag
+    response = send_file(path, mimetype='text/html', etag=transcript_key(student), conditional=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/transcript')
+def transcript():
+    if 'student_id' not in session:
+        return redirect(url_for('login'))
+    
+    try:
+        response = send_transcript(session['student_id'])
+        if response:
+            return response
+    except Error as e:
+        flash('Error generating transcript!', 'error')
+    
+    return redirect(url_for('grades'))
+
 @app.route('/announcements')
 def announcements():
     if 'student_id' not in session:
         return redirect(url_for('login'))
     
-    connection = get_db_connection()
-    if connection:
-        try:
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM announcements ORDER BY created_at DESC")
-            announcements = cursor.fetchall()
-            return render_template('announcements.html', announcements=announcements)
-        except Error as e:
-            flash('Error loading announcements!', 'error')
-        finally:
-            connection.close()
+    try:
+        announcements, etag, last_modified = get_announcements()
+        return conditional_response(
+            page_etag(etag),
+            last_modified,
+            lambda: render_template('announcements.html', announcements=announcements)
+        )
+    except Error as e:
+        flash('Error loading announcements!', 'error')
     
     return redirect(url_for('dashboard'))
 
@@ -562,6 +1044,42 @@ def admin_logout():
     return redirect(url_for('admin_login'))
 
 # Admin Dashboard
+COUNTER_RECONCILE_SECONDS = int(os.environ.get('COUNTER_RECONCILE_SECONDS', 3600))
+
+@job_queue.handler('reconcile_counters')
+def reconcile_counters(cursor=None):
+    """Reset every counter to the table's true row count.
+
+    Writes that commit while the counts run may be lost from the counter;
+    the next reconciliation puts them back. Pass a cursor to run it in the
+    caller's transaction, which the caller then commits.
+    """
+    if cursor is not None:
+        return reset_counters(cursor)
+    
+    connection = get_db_connection()
+    if not connection:
+        raise Error(msg='Database connection error')
+    try:
+        counts = reset_counters(connection.cursor())
+        connection.commit()
+        return counts
+    finally:
+        connection.close()
+
+def reset_counters(cursor):
+    counts = {}
+    for table in COUNTED_TABLES:
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        counts[table] = cursor.fetchone()[0]
+    
+    for name, value in counts.items():
+        cursor.execute("DELETE FROM counters WHERE name = %s", (name,))
+        cursor.execute("INSERT INTO counters (name, shard, value) VALUES (%s, 0, %s)", (name, value))
+    return counts
+
+job_queue.every('reconcile_counters', COUNTER_RECONCILE_SECONDS)
+
 @app.route('/admin/dashboard')
 @admin_required
 def admin_dashboard():
@@ -572,18 +1090,21 @@ def admin_dashboard():
         try:
             cursor = connection.cursor()
             
-            # Get statistics
-            cursor.execute("SELECT COUNT(*) FROM students")
-            stats['total_students'] = cursor.fetchone()[0]
-            
-            cursor.execute("SELECT COUNT(*) FROM courses")
-            stats['total_courses'] = cursor.fetchone()[0]
+            # Get statistics from the maintained counters
+            cursor.execute(
+                f"SELECT name, SUM(value) FROM counters WHERE name IN ({', '.join(['%s'] * len(COUNTED_TABLES))}) GROUP BY name",
+                COUNTED_TABLES
+            )
+            counts = {name: int(value) for name, value in cursor.fetchall()}
             
-            cursor.execute("SELECT COUNT(*) FROM announcements")
-            stats['total_announcements'] = cursor.fetchone()[0]
+            if len(counts) < len(COUNTED_TABLES):
+                # First run: nothing has been counted yet; count on this
+                # connection rather than checking out a second one
+                counts = reconcile_counters(cursor)
+                connection.commit()
             
-            cursor.execute("SELECT COUNT(*) FROM registrations")
-            stats['total_registrations'] = cursor.fetchone()[0]
+            for table in COUNTED_TABLES:
+                stats[f'total_{table}'] = counts[table]
             
         except Error as e:
             flash('Error loading dashboard data!', 'error')
@@ -592,30 +1113,151 @@ def admin_dashboard():
     
     return render_template('admin/dashboard.html', stats=stats)
 
+@app.route('/admin/db_pool')
+@admin_required
+def admin_db_pool():
+    """Connection pool counters for this worker"""
+    return jsonify(db_pool.stats())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Request and pool metrics of every worker in Prometheus text format; local scrapers only"""
+    if request.remote_addr not in METRICS_ALLOWED_ADDRS:
+        return make_response('Not Found', 404)
+    response = make_response(metrics.render())
+    response.mimetype = 'text/plain'
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+@app.route('/admin/profiles')
+@admin_required
+def admin_profiles():
+    """Stored request profiles, newest first"""
+    return jsonify(list_profiles())
+
+@app.route('/admin/profiles/<profile_id>')
+@admin_required
+def download_profile(profile_id):
+    """A stored profile as JSON, or ?format=folded for flame graph tools"""
+    path = profile_path(profile_id)
+    if not path:
+        return make_response('Profile not found', 404)
+    if request.args.get('format') == 'folded':
+        with open(path) as f:
+            stacks = json.load(f)['stacks']
+        response = make_response(stacks + '\n')
+        response.mimetype = 'text/plain'
+        response.headers['Content-Disposition'] = f'attachment; filename={profile_id}.folded'
+        return response
+    return send_file(path, mimetype='application/json', as_attachment=True, download_name=f'{profile_id}.json')
+
+@app.cli.command('profile-token')
+@click.argument('path')
+@click.option('--ttl', type=int, default=PROFILE_TOKEN_TTL, help='Seconds the token stays valid')
+def profile_token_command(path, ttl):
+    """Print the X-Profile-Token header value that profiles requests to PATH"""
+    if not PROFILE_SECRET:
+        raise click.ClickException('Set PROFILE_SECRET or SECRET_KEY to sign profile tokens')
+    click.echo(profile_token(PROFILE_SECRET, path, ttl))
+
+@app.route('/admin/jobs')
+@admin_required
+def admin_jobs():
+    """Background job queue depth and latency"""
+    return jsonify(job_queue.stats())
+
 # Admin Student Management
+ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', 50))
+
+def like_prefix(text):
+    """Escape LIKE wildcards in user input and turn it into a prefix pattern"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
 @app.route('/admin/students')
 @admin_required
 def admin_students():
+    filters = {
+        'faculty': request.args.get('faculty', '').strip(),
+        'major': request.args.get('major', '').strip(),
+        'enrollment_year': request.args.get('enrollment_year', '').strip(),
+        'q': request.args.get('q', '').strip(),
+    }
+    after = request.args.get('after', '')
+    
+    conditions = []
+    params = []
+    if filters['faculty']:
+        conditions.append("s.faculty = %s")
+        params.append(filters['faculty'])
+    if filters['major']:
+        conditions.append("s.major = %s")
+        params.append(filters['major'])
+    if filters['enrollment_year'].isdigit():
+        conditions.append("s.enrollment_year = %s")
+        params.append(int(filters['enrollment_year']))
+    if filters['q']:
+        # Prefix matches so each branch can use its column index
+        pattern = like_prefix(filters['q'])
+        conditions.append("(s.university_id LIKE %s OR s.email LIKE %s OR s.first_name LIKE %s OR s.last_name LIKE %s)")
+        params += [like_prefix(filters['q'].upper()), pattern, pattern, pattern]
+    
+    # Keyset pagination: continue strictly after the last (created_at, id) of the previous page
+    if after:
+        try:
+            after_created, after_id = after.rsplit('|', 1)
+            after_created = datetime.fromisoformat(after_created)
+            conditions.append("(s.created_at < %s OR (s.created_at = %s AND s.id < %s))")
+            params += [after_created, after_created, int(after_id)]
+        except ValueError:
+            after = ''
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    
     connection = get_db_connection()
     students = []
+    next_cursor = None
     
     if connection:
         try:
             cursor = connection.cursor(dictionary=True)
-            cursor.execute("""
-                SELECT s.*, COUNT(r.id) as registered_courses
-                FROM students s 
-                LEFT JOIN registrations r ON s.id = r.student_id
-                GROUP BY s.id
-                ORDER BY s.created_at DESC
-            """)
+            cursor.execute(f"""
+                SELECT s.id, s.university_id, s.first_name, s.last_name, s.email, s.phone_number,
+                       s.faculty, s.major, s.enrollment_year, s.created_at
+                FROM students s
+                {where}
+                ORDER BY s.created_at DESC, s.id DESC
+                LIMIT %s
+            """, (*params, ADMIN_PAGE_SIZE + 1))
             students = cursor.fetchall()
+            
+            if len(students) > ADMIN_PAGE_SIZE:
+                students = students[:ADMIN_PAGE_SIZE]
+                last = students[-1]
+                next_cursor = f"{last['created_at'].isoformat(sep=' ')}|{last['id']}"
+            
+            # Registration counts for the visible page only
+            counts = {}
+            if students:
+                ids = [student['id'] for student in students]
+                cursor.execute(
+                    f"SELECT student_id, COUNT(*) AS registered_courses FROM registrations WHERE student_id IN ({', '.join(['%s'] * len(ids))}) GROUP BY student_id",
+                    ids
+                )
+                counts = {row['student_id']: row['registered_courses'] for row in cursor.fetchall()}
+            for student in students:
+                student['registered_courses'] = counts.get(student['id'], 0)
         except Error as e:
             flash('Error loading students!', 'error')
         finally:
             connection.close()
     
-    return render_template('admin/students.html', students=students)
+    return render_template('admin/students.html',
+                         students=students,
+                         filters=filters,
+                         active_filters={key: value for key, value in filters.items() if value},
+                         faculties=list(FACULTY_MAJORS),
+                         is_first_page=not after,
+                         next_cursor=next_cursor)
 
 # Delete Student
 @app.route('/admin/students/delete/<int:student_id>')
@@ -628,10 +1270,12 @@ def delete_student(student_id):
             
             # First delete related records to maintain referential integrity
             cursor.execute("DELETE FROM registrations WHERE student_id = %s", (student_id,))
+            bump_counter(cursor, 'registrations', -cursor.rowcount)
             cursor.execute("DELETE FROM grades WHERE student_id = %s", (student_id,))
             
             # Then delete the student
             cursor.execute("DELETE FROM students WHERE id = %s", (student_id,))
+            bump_counter(cursor, 'students', -cursor.rowcount)
             connection.commit()
             
             flash('Student deleted successfully!', 'success')
@@ -672,11 +1316,18 @@ def delete_course(course_id):
             
             # First delete related records
             cursor.execute("DELETE FROM registrations WHERE course_id = %s", (course_id,))
+            bump_counter(cursor, 'registrations', -cursor.rowcount)
+            cursor.execute("SELECT DISTINCT student_id FROM grades WHERE course_id = %s", (course_id,))
+            graded_students = [row[0] for row in cursor.fetchall()]
             cursor.execute("DELETE FROM grades WHERE course_id = %s", (course_id,))
+            recompute_gpa(cursor, student_ids=graded_students)
+            grades_changed(cursor, graded_students)
             
             # Then delete the course
             cursor.execute("DELETE FROM courses WHERE id = %s", (course_id,))
+            bump_counter(cursor, 'courses', -cursor.rowcount)
             connection.commit()
+            forget_course(course_id)
             
             flash('Course deleted successfully!', 'success')
         except Error as e:
@@ -690,18 +1341,11 @@ def delete_course(course_id):
 @app.route('/admin/announcements')
 @admin_required
 def admin_announcements():
-    connection = get_db_connection()
     announcements = []
-    
-    if connection:
-        try:
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute("SELECT * FROM announcements ORDER BY created_at DESC")
-            announcements = cursor.fetchall()
-        except Error as e:
-            flash('Error loading announcements!', 'error')
-        finally:
-            connection.close()
+    try:
+        announcements, _, _ = get_announcements()
+    except Error as e:
+        flash('Error loading announcements!', 'error')
     
     return render_template('admin/announcements.html', announcements=announcements)
 
@@ -722,6 +1366,7 @@ def create_announcement():
                     "INSERT INTO announcements (title, content, author, is_important) VALUES (%s, %s, %s, %s)",
                     (title, content, author, is_important)
                 )
+                bump_counter(cursor, 'announcements', 1)
                 connection.commit()
                 flash('Announcement created successfully!', 'success')
                 return redirect(url_for('admin_announcements'))
@@ -741,6 +1386,7 @@ def delete_announcement(announcement_id):
         try:
             cursor = connection.cursor()
             cursor.execute("DELETE FROM announcements WHERE id = %s", (announcement_id,))
+            bump_counter(cursor, 'announcements', -cursor.rowcount)
             connection.commit()
             flash('Announcement deleted successfully!', 'success')
         except Error as e:
@@ -754,26 +1400,87 @@ def delete_announcement(announcement_id):
 @app.route('/admin/grades')
 @admin_required
 def admin_grades():
+    filters = {
+        'term': request.args.get('term', ''),
+        'course_id': request.args.get('course_id', ''),
+        'student': request.args.get('student', '').strip().upper(),
+    }
+    after = request.args.get('after', '')
+    
     connection = get_db_connection()
     grades = []
+    terms = []
+    courses = []
+    next_cursor = None
     
     if connection:
         try:
             cursor = connection.cursor(dictionary=True)
-            cursor.execute("""
+            
+            # Terms and courses for the filter dropdowns
+            cursor.execute("SELECT DISTINCT academic_year, semester FROM grades ORDER BY academic_year DESC, semester DESC")
+            terms = [f"{row['semester']} {row['academic_year']}" for row in cursor.fetchall()]
+            cursor.execute("SELECT id, course_code, course_name FROM courses ORDER BY course_code")
+            courses = cursor.fetchall()
+            
+            # Show the latest term unless another term (or 'all') was picked
+            if not filters['term'] and terms:
+                filters['term'] = terms[0]
+            
+            conditions = []
+            params = []
+            if filters['term'] and filters['term'] != 'all':
+                semester, _, academic_year = filters['term'].rpartition(' ')
+                conditions.append("g.academic_year = %s AND g.semester = %s")
+                params += [academic_year, semester]
+            if filters['course_id'].isdigit():
+                conditions.append("g.course_id = %s")
+                params.append(int(filters['course_id']))
+            if filters['student']:
+                conditions.append("g.student_id = (SELECT id FROM students WHERE university_id = %s)")
+                params.append(filters['student'])
+            
+            # Keyset pagination on the sort key (academic_year, semester, id)
+            if after:
+                try:
+                    after_year, after_semester, after_id = after.split('|')
+                    conditions.append(
+                        "(g.academic_year < %s OR (g.academic_year = %s AND g.semester < %s)"
+                        " OR (g.academic_year = %s AND g.semester = %s AND g.id < %s))"
+                    )
+                    params += [after_year, after_year, after_semester, after_year, after_semester, int(after_id)]
+                except ValueError:
+                    after = ''
+            
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+            cursor.execute(f"""
                 SELECT g.*, s.university_id, s.first_name, s.last_name, c.course_code, c.course_name
                 FROM grades g
                 JOIN students s ON g.student_id = s.id
                 JOIN courses c ON g.course_id = c.id
-                ORDER BY g.academic_year DESC, g.semester DESC
-            """)
+                {where}
+                ORDER BY g.academic_year DESC, g.semester DESC, g.id DESC
+                LIMIT %s
+            """, (*params, ADMIN_PAGE_SIZE + 1))
             grades = cursor.fetchall()
+            
+            if len(grades) > ADMIN_PAGE_SIZE:
+                grades = grades[:ADMIN_PAGE_SIZE]
+                last = grades[-1]
+                next_cursor = f"{last['academic_year']}|{last['semester']}|{last['id']}"
         except Error as e:
             flash('Error loading grades!', 'error')
         finally:
             connection.close()
     
-    return render_template('admin/grades.html', grades=grades)
+    return render_template('admin/grades.html',
+                         grades=grades,
+                         terms=terms,
+                         courses=courses,
+                         filters=filters,
+                         active_filters={key: value for key, value in filters.items() if value},
+                         is_first_page=not after,
+                         next_cursor=next_cursor)
 
 # Delete Grade
 @app.route('/admin/grades/delete/<int:grade_id>')
@@ -783,7 +1490,12 @@ def delete_grade(grade_id):
     if connection:
         try:
             cursor = connection.cursor()
+            cursor.execute("SELECT student_id, academic_year, semester FROM grades WHERE id = %s", (grade_id,))
+            graded = cursor.fetchone()
             cursor.execute("DELETE FROM grades WHERE id = %s", (grade_id,))
+            if graded:
+                refresh_term_gpa(cursor, *graded)
+                grades_changed(cursor, [graded[0]])
             connection.commit()
             flash('Grade deleted successfully!', 'success')
         except Error as e:
@@ -809,27 +1521,14 @@ def assign_grade():
             try:
                 cursor = connection.cursor()
                 
-                # Check if grade already exists
-                cursor.execute(
-                    "SELECT * FROM grades WHERE student_id = %s AND course_id = %s AND semester = %s AND academic_year = %s",
-                    (student_id, course_id, semester, academic_year)
-                )
-                existing_grade = cursor.fetchone()
-                
-                if existing_grade:
-                    # Update existing grade
-                    cursor.execute(
-                        "UPDATE grades SET grade = %s WHERE student_id = %s AND course_id = %s AND semester = %s AND academic_year = %s",
-                        (grade, student_id, course_id, semester, academic_year)
-                    )
-                    flash('Grade updated successfully!', 'success')
-                else:
-                    # Insert new grade
-                    cursor.execute(
-                        "INSERT INTO grades (student_id, course_id, grade, semester, academic_year) VALUES (%s, %s, %s, %s, %s)",
-                        (student_id, course_id, grade, semester, academic_year)
-                    )
+                # One statement; the unique key decides between insert and update
+                cursor.execute(UPSERT_GRADE, (student_id, course_id, grade, semester, academic_year))
+                if cursor.rowcount == 1:
                     flash('Grade assigned successfully!', 'success')
+                else:
+                    flash('Grade updated successfully!', 'success')
+                refresh_term_gpa(cursor, student_id, academic_year, semester)
+                grades_changed(cursor, [student_id])
                 
                 connection.commit()
                 return redirect(url_for('admin_grades'))
@@ -858,6 +1557,235 @@ def assign_grade():
     
     return render_template('admin/assign_grade.html', students=students, courses=courses)
 
+# Bulk Grade Upload
+# Grades resolved and upserted per round trip
+GRADE_UPLOAD_BATCH_SIZE = int(os.environ.get('GRADE_UPLOAD_BATCH_SIZE', 500))
+
+def post_grades(connection, rows, defaults, batch_size=GRADE_UPLOAD_BATCH_SIZE):
+    """Upsert uploaded (line, row) grades in batches and return a report.
+
+    Each batch costs three round trips: student ids, course ids and one
+    multi-row upsert. Rows with errors are skipped and reported; the rest
+    are committed together, so a failed upload leaves no partial section.
+    """
+    report = {'rows': 0, 'posted': 0, 'errors': [], 'seconds': 0}
+    started = time.perf_counter()
+    cursor = connection.cursor()
+    
+    def flush(batch):
+        students, courses = resolve_ids(cursor, [grade for _, grade in batch])
+        values = []
+        for line, grade in batch:
+            student_id = students.get(grade['university_id'])
+            course_id = courses.get(grade['course_code'])
+            if student_id is None:
+                report['errors'].append([line, f"Unknown university ID {grade['university_id']}"])
+            elif course_id is None:
+                report['errors'].append([line, f"Unknown course {grade['course_code']}"])
+            else:
+                values.append((student_id, course_id, grade['grade'], grade['semester'], grade['academic_year']))
+        report['posted'] += upsert_grades(cursor, values)
+    
+    batch = []
+    for line, row in rows:
+        report['rows'] += 1
+        try:
+            batch.append((line, clean_grade_row(row, defaults)))
+        except ValueError as e:
+            report['errors'].append([line, str(e)])
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    connection.commit()
+    
+    report['errors'].sort()
+    report['seconds'] = round(time.perf_counter() - started, 2)
+    return report
+
+@app.route('/admin/grades/upload', methods=['GET', 'POST'])
+@admin_required
+def upload_grades():
+    report = None
+    connection = get_db_connection()
+    if connection:
+        try:
+            if request.method == 'POST':
+                upload = request.files.get('file')
+                if not upload or not upload.filename:
+                    flash('Please choose a CSV or JSON file to upload!', 'error')
+                else:
+                    defaults = {column: request.form.get(column, '').strip() for column in ('course_code', 'semester', 'academic_year')}
+                    try:
+                        report = post_grades(connection, read_grade_rows(upload.stream, upload.filename), defaults)
+                        flash(f"Posted {report['posted']} of {report['rows']} grades!", 'success' if not report['errors'] else 'error')
+                    except (ValueError, UnicodeDecodeError) as e:
+                        connection.rollback()
+                        flash(f'Could not read {upload.filename}: {e}', 'error')
+                    except Error as e:
+                        connection.rollback()
+                        flash(f'Error posting grades: {e}', 'error')
+            
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("SELECT course_code, course_name FROM courses ORDER BY course_code")
+            courses = cursor.fetchall()
+        except Error as e:
+            courses = []
+            flash('Error loading courses!', 'error')
+        finally:
+            connection.close()
+    else:
+        courses = []
+        flash('Database connection error!', 'error')
+    
+    return render_template('admin/upload_grades.html', courses=courses, semesters=SEMESTERS, report=report)
+
+# Academic Standing Reports
+@app.route('/admin/reports/gpa')
+@admin_required
+def gpa_reports():
+    report = request.args.get('report', 'deans_list')
+    if report not in ('deans_list', 'probation'):
+        report = 'deans_list'
+    filters = {
+        'term': request.args.get('term', '').strip(),
+        'enrollment_year': request.args.get('enrollment_year', '').strip(),
+        'major': request.args.get('major', '').strip(),
+    }
+    enrollment_year = int(filters['enrollment_year']) if filters['enrollment_year'].isdigit() else None
+    major = filters['major'] or None
+    
+    terms = []
+    students = []
+    connection = get_db_connection()
+    if connection:
+        try:
+            cursor = connection.cursor(dictionary=True)
+            cursor.execute("SELECT DISTINCT academic_year, semester FROM term_gpa ORDER BY academic_year DESC, semester DESC")
+            terms = [f"{row['semester']} {row['academic_year']}" for row in cursor.fetchall()]
+            
+            if report == 'deans_list':
+                if filters['term'] not in terms:
+                    filters['term'] = terms[0] if terms else ''
+                if filters['term']:
+                    semester, _, academic_year = filters['term'].rpartition(' ')
+                    students = deans_list(cursor, academic_year, semester, enrollment_year, major)
+            else:
+                students = probation_list(cursor, enrollment_year, major)
+        except Error as e:
+            flash('Error loading report!', 'error')
+        finally:
+            connection.close()
+    
+    return render_template('admin/gpa_reports.html',
+                         report=report,
+                         filters=filters,
+                         terms=terms,
+                         majors=sorted({major for majors in FACULTY_MAJORS.values() for major in majors}),
+                         students=students,
+                         deans_list_gpa=DEANS_LIST_GPA,
+                         deans_list_min_credits=DEANS_LIST_MIN_CREDITS,
+                         probation_gpa=PROBATION_GPA)
+
+@app.route('/admin/reports/gpa/recompute', methods=['POST'])
+@admin_required
+def recompute_gpa_reports():
+    """Rebuild the GPA aggregates for a cohort, or for everyone"""
+    enrollment_year = request.form.get('enrollment_year', '').strip()
+    major = request.form.get('major', '').strip()
+    connection = get_db_connection()
+    if connection:
+        try:
+            cursor = connection.cursor()
+            students = recompute_gpa(cursor, enrollment_year=int(enrollment_year) if enrollment_year.isdigit() else None, major=major or None)
+            connection.commit()
+            flash(f'Recomputed GPA for {students} students!', 'success')
+        except Error as e:
+            flash(f'Error recomputing GPA: {e}', 'error')
+        finally:
+            connection.close()
+    else:
+        flash('Database connection error!', 'error')
+    
+    return redirect(request.referrer or url_for('gpa_reports'))
+
+@app.route('/admin/students/<int:student_id>/transcript')
+@admin_required
+def admin_transcript(student_id):
+    try:
+        response = send_transcript(student_id)
+        if response:
+            return response
+        flash('Student not found!', 'error')
+    except Error as e:
+        flash(f'Error generating transcript: {e}', 'error')
+    
+    return redirect(url_for('admin_students'))
+
+def pregenerate_cohort(enrollment_year, major=None, processes=TRANSCRIPT_PROCESSES):
+    """Render the transcripts a cohort is missing; returns (students, rendered)"""
+    connection = get_db_connection()
+    if not connection:
+        raise Error(msg='Database connection error')
+    try:
+        records = load_cohort(connection.cursor(dictionary=True), enrollment_year, major)
+    finally:
+        # Rendering takes a while; don't hold a pooled connection for it
+        connection.close()
+    return len(records), pregenerate(records, processes)
+
+@job_queue.handler('pregenerate_transcripts')
+def pregenerate_transcripts_job(enrollment_year, major=None):
+    pregenerate_cohort(enrollment_year, major)
+
+@app.route('/admin/transcripts/pregenerate', methods=['POST'])
+@admin_required
+def pregenerate_transcripts():
+    """Queue transcript generation for a graduating cohort"""
+    enrollment_year = request.form.get('enrollment_year', '').strip()
+    major = request.form.get('major', '').strip()
+    if not enrollment_year.isdigit():
+        flash('Choose an enrollment year to generate transcripts for!', 'error')
+        return redirect(request.referrer or url_for('admin_students'))
+    
+    try:
+        job_queue.enqueue('pregenerate_transcripts', enrollment_year=int(enrollment_year), major=major or None)
+        flash(f'Generating transcripts for the {enrollment_year} cohort!', 'success')
+    except Error as e:
+        flash(f'Error starting transcript generation: {e}', 'error')
+    
+    return redirect(request.referrer or url_for('admin_students'))
+
+@app.cli.command('pregenerate-transcripts')
+@click.argument('enrollment_year', type=int)
+@click.option('--major', default=None)
+@click.option('--processes', type=int, default=TRANSCRIPT_PROCESSES)
+def pregenerate_transcripts_command(enrollment_year, major, processes):
+    """Render every missing transcript for the students enrolled in ENROLLMENT_YEAR"""
+    started = time.perf_counter()
+    try:
+        students, rendered = pregenerate_cohort(enrollment_year, major, processes)
+    except Error as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Rendered {rendered} of {students} transcripts in {time.perf_counter() - started:.1f}s")
+
+@app.cli.command('recompute-gpa')
+@click.option('--enrollment-year', type=int, default=None)
+@click.option('--major', default=None)
+def recompute_gpa_command(enrollment_year, major):
+    """Rebuild the GPA aggregates for a cohort, or for every student"""
+    connection = get_db_connection()
+    if not connection:
+        raise click.ClickException('Database connection error')
+    try:
+        started = time.perf_counter()
+        students = recompute_gpa(connection.cursor(), enrollment_year=enrollment_year, major=major)
+        connection.commit()
+    finally:
+        connection.close()
+    click.echo(f"Recomputed GPA for {students} students in {time.perf_counter() - started:.1f}s")
+
 # Help Desk Chatbot
 @app.route('/help')
 def help_desk():
@@ -870,53 +1798,26 @@ def chatbot_response():
     if 'student_id' not in session:
         return redirect(url_for('login'))
     
-    user_message = request.json.get('message', '').lower()
-    
-    # Simple chatbot responses
-    responses = {
-        'hello': "Hello! How can I help you with the student portal today?",
-        'hi': "Hi there! What can I assist you with?",
-        'grades': "You can view your grades in the 'Grades' section. If you have issues, contact the administration office.",
-        'courses': "You can register for courses in the 'Course Registration' section. Required courses for your program are automatically assigned.",
-        'registration': "Course registration is available in the 'Course Registration' section. You can also drop courses from there.",
-        'profile': "Update your personal information in the 'My Profile' section.",
-        'announcements': "Check the 'Announcements' section for latest university updates.",
-        'password': "If you forgot your password, please contact the IT help desk for password reset.",
-        'login': "Make sure you're using your University ID to login.",
-        'contact': "For urgent matters, contact:\n- IT Help Desk: it-support@university.edu\n- Administration: admin@university.edu\n- Phone: +1 (555) 123-4567",
-        'hours': "University office hours:\nMonday-Friday: 8:00 AM - 6:00 PM\nSaturday: 9:00 AM - 1:00 PM",
-        'deadline': "Important deadlines:\n- Course registration: End of first week\n- Grade appeals: Within 7 days of posting\n- Fee payment: 15th of each month",
-        'help': "I can help with:\n- Grades and courses\n- Registration issues\n- Profile updates\n- University contacts\n- Office hours and deadlines",
-    }
-    
-    # Find the best matching response
-    response = "I'm not sure I understand. Try asking about:\n- Grades\n- Course registration\n- Profile updates\n- Contact information\n- Office hours\nOr type 'help' for more options."
+    user_message = request.json.get('message', '')
     
-    for keyword, bot_response in responses.items():
-        if keyword in user_message:
-            response = bot_response
-            break
-    
-    return {'response': response}
+    return {'response': get_helpdesk().answer(user_message)}
 
 @app.route('/timetable')
 def timetable():
     if 'student_id' not in session:
         return redirect(url_for('login'))
     
-    # Static timetable data - always visible for prototype
-    static_timetable = [
-        {'day': 'Monday', 'time': '8:00 AM - 9:30 AM', 'course_code': 'CS101', 'course_name': 'Introduction to Programming', 'instructor': 'Dr. Smith', 'room': 'Room 101'},
-        {'day': 'Monday', 'time': '11:30 AM - 1:00 PM', 'course_code': 'MATH201', 'course_name': 'Calculus I', 'instructor': 'Dr. Johnson', 'room': 'Room 202'},
-        {'day': 'Tuesday', 'time': '9:45 AM - 11:15 AM', 'course_code': 'PHY101', 'course_name': 'Physics I', 'instructor': 'Dr. Wilson', 'room': 'Room 305'},
-        {'day': 'Tuesday', 'time': '1:30 PM - 3:00 PM', 'course_code': 'ENG101', 'course_name': 'English Composition', 'instructor': 'Prof. Davis', 'room': 'Room 410'},
-        {'day': 'Wednesday', 'time': '8:00 AM - 9:30 AM', 'course_code': 'CS101', 'course_name': 'Introduction to Programming', 'instructor': 'Dr. Smith', 'room': 'Room 101'},
-        {'day': 'Wednesday', 'time': '11:30 AM - 1:00 PM', 'course_code': 'MATH201', 'course_name': 'Calculus I', 'instructor': 'Dr. Johnson', 'room': 'Room 202'},
-        {'day': 'Thursday', 'time': '9:45 AM - 11:15 AM', 'course_code': 'PHY101', 'course_name': 'Physics I', 'instructor': 'Dr. Wilson', 'room': 'Room 305'},
-        {'day': 'Friday', 'time': '1:30 PM - 3:00 PM', 'course_code': 'ENG101', 'course_name': 'English Composition', 'instructor': 'Prof. Davis', 'room': 'Room 410'}
-    ]
+    connection = get_db_connection()
+    if connection:
+        try:
+            week = student_week(connection.cursor(dictionary=True), session['student_id'], CURRENT_SEMESTER)
+            return render_template('timetable.html', timetable_data=week.entries, week=week, semester=CURRENT_SEMESTER)
+        except Error as e:
+            flash('Error loading timetable!', 'error')
+        finally:
+            connection.close()
     
-    return render_template('timetable.html', timetable_data=static_timetable)
+    return redirect(url_for('dashboard'))
 
 # Add New Student - Admin
 @app.route('/admin/students/add', methods=['GET', 'POST'])
@@ -963,15 +1864,16 @@ def add_student():
                     "INSERT INTO students (university_id, faculty, first_name, last_name, email, phone_number, password, major, enrollment_year) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)",
                     (university_id, faculty, first_name, last_name, email, phone_number, hashed_password, major, enrollment_year)
                 )
-                connection.commit()
+                student_id = cursor.lastrowid
+                bump_counter(cursor, 'students', 1)
                 
-                # Get the new student ID
-                cursor.execute("SELECT id FROM students WHERE university_id = %s", (university_id,))
-                student_id = cursor.fetchone()[0]
-                
-                # Assign sample grades and courses
-                assign_sample_grades(student_id)
-                assign_program_courses(student_id, major)
+                # Queue sample grades and courses
+                job_ids = [
+                    job_queue.enqueue('assign_sample_grades', cursor, student_id=student_id),
+                    job_queue.enqueue('assign_program_courses', cursor, student_id=student_id, major=major),
+                ]
+                connection.commit()
+                job_queue.dispatch(*job_ids)
                 
                 flash(f'Student {first_name} {last_name} added successfully! University ID: {university_id}', 'success')
                 return redirect(url_for('admin_students'))
@@ -985,76 +1887,292 @@ def add_student():
     
     return render_template('admin/add_student.html')
 
-# Admin Statistics & Reports - WORKING VERSION
-@app.route('/admin/statistics')
-@admin_required
-def admin_statistics():
+# Bulk Student Import
+# Rows validated, checked, hashed and inserted together
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 500))
+# Uploaded CSVs wait here for the import job; must be shared if workers run on several hosts
+IMPORT_DIR = os.environ.get('IMPORT_DIR', os.path.join(tempfile.gettempdir(), 'student_imports'))
+# Per-row errors kept in a report; the total is always counted
+IMPORT_MAX_ERRORS = 1000
+
+def import_students(lines, rounds=None, batch_size=IMPORT_BATCH_SIZE):
+    """Import students from CSV lines in batches and return a report.
+
+    Each batch is validated, checked for duplicates with one query, hashed
+    on every core and inserted with one executemany in its own transaction,
+    so a bad row only costs itself and a failed batch does not undo earlier
+    ones. The new students of each major are registered for its program
+    courses, and sample grades are left as jobs for the background workers.
+    """
+    report = {'rows': 0, 'imported': 0, 'error_count': 0, 'errors': [], 'seconds': 0, 'rows_per_second': 0}
+    
+    def reject(line, message):
+        report['error_count'] += 1
+        if len(report['errors']) < IMPORT_MAX_ERRORS:
+            report['errors'].append([line, message])
+    
     connection = get_db_connection()
-    stats = {}
+    if not connection:
+        raise Error(msg='Database connection error')
+    started = time.perf_counter()
+    try:
+        cursor = connection.cursor()
+        with bulk_hasher() as pool:
+            for batch in read_batches(lines, batch_size):
+                report['rows'] += len(batch)
+                students = []
+                for line, row in batch:
+                    try:
+                        students.append((line, clean_row(row)))
+                    except ValueError as e:
+                        reject(line, str(e))
+                if not students:
+                    continue
+                
+                students, duplicates = split_duplicates(cursor, students)
+                for line, message in duplicates:
+                    reject(line, message)
+                if not students:
+                    continue
+                
+                hashes = hash_many(pool, [student['password'] for _, student in students], rounds)
+                try:
+                    cursor.executemany(
+                        f"INSERT INTO students ({', '.join(STUDENT_COLUMNS)}) VALUES ({', '.join(['%s'] * len(STUDENT_COLUMNS))})",
+                        [tuple(hashed if column == 'password' else student[column] for column in STUDENT_COLUMNS)
+                         for (_, student), hashed in zip(students, hashes)]
+                    )
+                    bump_counter(cursor, 'students', len(students))
+                    
+                    majors = {student['university_id']: student['major'] for _, student in students}
+                    cursor.execute(
+                        f"SELECT id, university_id FROM students WHERE university_id IN ({', '.join(['%s'] * len(majors))})",
+                        list(majors)
+                    )
+                    job_ids = []
+                    new_students = {}
+                    for student_id, university_id in cursor.fetchall():
+                        job_ids.append(job_queue.enqueue('assign_sample_grades', cursor, student_id=student_id))
+                        new_students.setdefault(majors[university_id], []).append(student_id)
+                    # Only this batch's students: the rest of their cohort keeps
+                    # its registrations, including courses it has dropped
+                    for major, student_ids in new_students.items():
+                        enroll_program_courses(cursor, major, student_ids=student_ids)
+                    connection.commit()
+                    job_queue.dispatch(*job_ids)
+                    report['imported'] += len(students)
+                except IntegrityError as e:
+                    # Someone registered one of these students since the duplicate check
+                    connection.rollback()
+                    for line, _ in students:
+                        reject(line, f"Batch not imported: {e.msg}")
+    finally:
+        connection.close()
+    
+    report['seconds'] = round(time.perf_counter() - started, 2)
+    report['rows_per_second'] = round(report['rows'] / report['seconds'], 1) if report['seconds'] else 0
+    return report
+
+@job_queue.handler('import_students')
+def import_students_job(path):
+    """Run an uploaded import and leave its report next to the CSV"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        try:
+            report = import_students(f)
+        except ValueError as e:
+            report = {'rows': 0, 'imported': 0, 'error_count': 1, 'errors': [[1, str(e)]], 'seconds': 0, 'rows_per_second': 0}
+    with open(f'{path}.report.json', 'w') as f:
+        json.dump(report, f)
+    os.remove(path)
+
+@app.cli.command('import-students')
+@click.argument('csv_file', type=click.Path(exists=True, dir_okay=False))
+@click.option('--rounds', type=int, default=None, help='bcrypt work factor; defaults to BCRYPT_ROUNDS')
+@click.option('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+def import_students_command(csv_file, rounds, batch_size):
+    """Import students from CSV_FILE"""
+    with open(csv_file, newline='', encoding='utf-8-sig') as f:
+        try:
+            report = import_students(f, rounds=rounds, batch_size=batch_size)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    for line, message in report['errors']:
+        click.echo(f"line {line}: {message}")
+    click.echo(
+        f"Imported {report['imported']} of {report['rows']} rows ({report['error_count']} errors) "
+        f"in {report['seconds']}s, {report['rows_per_second']} rows/s"
+    )
+
+@app.route('/admin/students/import', methods=['GET', 'POST'])
+@admin_required
+def import_students_upload():
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV file to import!', 'error')
+            return render_template('admin/import_students.html', columns=STUDENT_COLUMNS)
+        
+        # Spool the upload to disk; the import runs on a background worker
+        os.makedirs(IMPORT_DIR, exist_ok=True)
+        path = os.path.join(IMPORT_DIR, f"{uuid4().hex}.csv")
+        upload.save(path)
+        try:
+            job_id = job_queue.enqueue('import_students', path=path)
+        except Error as e:
+            os.remove(path)
+            flash(f'Error starting import: {e}', 'error')
+            return render_template('admin/import_students.html', columns=STUDENT_COLUMNS)
+        
+        flash(f'Import of {upload.filename} started!', 'success')
+        return redirect(url_for('import_students_status', job_id=job_id))
     
+    return render_template('admin/import_students.html', columns=STUDENT_COLUMNS)
+
+@app.route('/admin/students/import/<int:job_id>')
+@admin_required
+def import_students_status(job_id):
+    job = None
+    report = None
+    connection = get_db_connection()
     if connection:
         try:
             cursor = connection.cursor(dictionary=True)
-            
-            # Basic counts
-            cursor.execute("SELECT COUNT(*) as count FROM students")
-            stats['total_students'] = cursor.fetchone()['count']
-            
-            cursor.execute("SELECT COUNT(*) as count FROM courses")
-            stats['total_courses'] = cursor.fetchone()['count']
-            
-            cursor.execute("SELECT COUNT(*) as count FROM announcements")
-            stats['total_announcements'] = cursor.fetchone()['count']
-            
-            cursor.execute("SELECT COUNT(*) as count FROM registrations")
-            stats['total_registrations'] = cursor.fetchone()['count']
-            
-            # Get all students and count manually
-            cursor.execute("SELECT faculty, enrollment_year FROM students")
-            students = cursor.fetchall()
-            
-            # Count by faculty
-            faculty_count = {}
-            for student in students:
-                faculty = student['faculty']
-                faculty_count[faculty] = faculty_count.get(faculty, 0) + 1
-            stats['faculty_data'] = [{'faculty': k, 'count': v} for k, v in faculty_count.items()]
-            
-            # Count by year
-            year_count = {}
-            for student in students:
-                year = student['enrollment_year']
-                year_count[year] = year_count.get(year, 0) + 1
-            stats['year_data'] = [{'year': k, 'count': v} for k, v in year_count.items()]
-            
-            # Get courses
-            cursor.execute("SELECT course_code, course_name, current_enrollment, max_capacity FROM courses ORDER BY current_enrollment DESC LIMIT 5")
-            stats['courses'] = cursor.fetchall()
-            
-            # Get recent activity
-            cursor.execute("SELECT first_name, last_name, created_at FROM students ORDER BY created_at DESC LIMIT 5")
-            stats['recent_students'] = cursor.fetchall()
-            
-            print("DEBUG: Statistics loaded successfully")
-            
-        except Exception as e:
-            print(f"DEBUG: Error in statistics: {e}")
-            # Set safe defaults
-            stats = {
-                'total_students': 0,
-                'total_courses': 0, 
-                'total_announcements': 0,
-                'total_registrations': 0,
-                'faculty_data': [],
-                'year_data': [],
-                'courses': [],
-                'recent_students': []
-            }
+            cursor.execute(
+                "SELECT id, status, attempts, last_error, payload, created_at, finished_at FROM jobs WHERE id = %s AND kind = 'import_students'",
+                (job_id,)
+            )
+            job = cursor.fetchone()
+        except Error as e:
+            flash('Error loading import status!', 'error')
         finally:
-            if connection:
-                connection.close()
+            connection.close()
+    
+    if not job:
+        flash('Import not found!', 'error')
+        return redirect(url_for('import_students_upload'))
+    
+    report_path = f"{json.loads(job['payload'])['path']}.report.json"
+    if os.path.exists(report_path):
+        with open(report_path) as f:
+            report = json.load(f)
+    
+    return render_template('admin/import_students.html', columns=STUDENT_COLUMNS, job=job, report=report)
+
+# Admin Statistics & Reports
+# Serve the snapshot from process memory for this long before re-reading it
+STATS_CACHE_SECONDS = int(os.environ.get('STATS_CACHE_SECONDS', 30))
+# Recompute the snapshot in the background once it is older than this
+STATS_REFRESH_SECONDS = int(os.environ.get('STATS_REFRESH_SECONDS', 300))
+
+stats_cache = {'stats': None, 'computed_at': None, 'loaded_at': 0, 'refresh_queued_at': 0}
+
+def compute_statistics(cursor):
+    """Aggregate the statistics page in SQL"""
+    stats = {}
+    cursor.execute("""
+        SELECT (SELECT COUNT(*) FROM students) AS total_students,
+               (SELECT COUNT(*) FROM courses) AS total_courses,
+               (SELECT COUNT(*) FROM announcements) AS total_announcements,
+               (SELECT COUNT(*) FROM registrations) AS total_registrations
+    """)
+    stats.update(cursor.fetchone())
     
-    return render_template('admin/statistics.html', stats=stats)
+    cursor.execute("SELECT faculty, COUNT(*) AS count FROM students GROUP BY faculty ORDER BY count DESC")
+    stats['faculty_data'] = cursor.fetchall()
+    
+    cursor.execute("SELECT enrollment_year AS year, COUNT(*) AS count FROM students GROUP BY enrollment_year ORDER BY enrollment_year DESC")
+    stats['year_data'] = cursor.fetchall()
+    
+    cursor.execute("SELECT course_code, course_name, current_enrollment, max_capacity FROM courses ORDER BY current_enrollment DESC LIMIT 5")
+    stats['courses'] = cursor.fetchall()
+    
+    cursor.execute("SELECT first_name, last_name, created_at FROM students ORDER BY created_at DESC LIMIT 5")
+    stats['recent_students'] = cursor.fetchall()
+    return stats
+
+@job_queue.handler('refresh_statistics')
+def refresh_statistics():
+    """Recompute the statistics snapshot and store it"""
+    connection = get_db_connection()
+    if not connection:
+        raise Error(msg='Database connection error')
+    try:
+        cursor = connection.cursor(dictionary=True)
+        stats = compute_statistics(cursor)
+        computed_at = datetime.now().replace(microsecond=0)
+        cursor.execute(
+            "REPLACE INTO stats_snapshots (name, payload, computed_at) VALUES ('admin_statistics', %s, %s)",
+            (json.dumps(stats, default=str), computed_at)
+        )
+        connection.commit()
+    finally:
+        connection.close()
+    
+    stats_cache.update(stats=stats, computed_at=computed_at, loaded_at=time.time())
+    return stats, computed_at
+
+def load_statistics():
+    """Return the latest statistics snapshot and when it was computed"""
+    if stats_cache['stats'] is not None and time.time() - stats_cache['loaded_at'] < STATS_CACHE_SECONDS:
+        return stats_cache['stats'], stats_cache['computed_at']
+    
+    connection = get_db_connection()
+    if not connection:
+        raise Error(msg='Database connection error')
+    try:
+        cursor = connection.cursor(dictionary=True)
+        cursor.execute("SELECT payload, computed_at FROM stats_snapshots WHERE name = 'admin_statistics'")
+        snapshot = cursor.fetchone()
+    finally:
+        connection.close()
+    
+    if not snapshot:
+        return refresh_statistics()
+    
+    stats = json.loads(snapshot['payload'])
+    for student in stats['recent_students']:
+        student['created_at'] = datetime.fromisoformat(student['created_at'])
+    computed_at = snapshot['computed_at']
+    stats_cache.update(stats=stats, computed_at=computed_at, loaded_at=time.time())
+    
+    # Stale snapshots are refreshed in the background; this request still gets the old one
+    age = (datetime.now() - computed_at).total_seconds()
+    if age > STATS_REFRESH_SECONDS and time.time() - stats_cache['refresh_queued_at'] > STATS_REFRESH_SECONDS:
+        stats_cache['refresh_queued_at'] = time.time()
+        job_queue.enqueue('refresh_statistics')
+    return stats, computed_at
+
+@app.route('/admin/statistics')
+@admin_required
+def admin_statistics():
+    computed_at = None
+    try:
+        stats, computed_at = load_statistics()
+    except Error as e:
+        flash('Error loading statistics!', 'error')
+        # Set safe defaults
+        stats = {
+            'total_students': 0,
+            'total_courses': 0, 
+            'total_announcements': 0,
+            'total_registrations': 0,
+            'faculty_data': [],
+            'year_data': [],
+            'courses': [],
+            'recent_students': []
+        }
+    
+    return render_template('admin/statistics.html', stats=stats, computed_at=computed_at)
+
+@app.route('/admin/statistics/refresh', methods=['POST'])
+@admin_required
+def refresh_admin_statistics():
+    try:
+        refresh_statistics()
+        flash('Statistics refreshed!', 'success')
+    except Error as e:
+        flash(f'Error refreshing statistics: {e}', 'error')
+    return redirect(url_for('admin_statistics'))
 
 # Add Course - Admin
 @app.route('/admin/courses/add', methods=['GET', 'POST'])
@@ -1089,8 +2207,13 @@ def add_course():
                     VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
                     (course_code, course_name, instructor, program, schedule_days, schedule_time, credits, max_capacity, description, 0)
                 )
+                new_course_id = cursor.lastrowid
+                bump_counter(cursor, 'courses', 1)
                 connection.commit()
                 
+                # Precompute the new course's slot bitmap for conflict checks
+                course_bitmap(new_course_id, schedule_days, schedule_time)
+                
                 flash(f'Course {course_code} - {course_name} added successfully!', 'success')
                 return redirect(url_for('admin_courses'))
                 
@@ -1181,6 +2304,8 @@ def edit_student(student_id):
     return redirect(url_for('admin_students'))
 
 if __name__ == '__main__':
+    # The development server has no deploy step to migrate for it
+    migrate_schema()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
 
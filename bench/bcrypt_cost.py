@@ -0,0 +1,51 @@
+"""Login throughput per core at each bcrypt work factor.
+
+Times bcrypt.checkpw, the CPU cost of one login, on a single thread and
+then on HASH_WORKERS threads through the same executor the app uses:
+
+    python -m bench.bcrypt_cost --rounds 10 11 12 13 --logins 20
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from passwords import HASH_WORKERS
+
+
+def logins_per_second(hashed, logins, threads):
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        started = time.perf_counter()
+        list(pool.map(lambda _: bcrypt.checkpw(b'benchmark-password', hashed), range(logins)))
+        return logins / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, nargs='+', default=[10, 11, 12, 13])
+    parser.add_argument('--logins', type=int, default=20, help='logins timed per setting')
+    parser.add_argument('--threads', type=int, default=HASH_WORKERS)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    results = []
+    for rounds in args.rounds:
+        hashed = bcrypt.hashpw(b'benchmark-password', bcrypt.gensalt(rounds))
+        single = logins_per_second(hashed, args.logins, 1)
+        parallel = logins_per_second(hashed, args.logins * args.threads, args.threads)
+        results.append({
+            'rounds': rounds,
+            'ms_per_login': round(1000 / single, 1),
+            'logins_per_s_per_core': round(single, 2),
+            'logins_per_s_executor': round(parallel, 2),
+            'executor_threads': args.threads,
+            'cores': cores,
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Compare two bench.traffic reports route by route.
+
+Prints throughput and p50/p95/p99 for every phase and route in both
+reports with the relative change, and exits non-zero if any latency
+percentile got worse by more than --threshold percent:
+
+    python -m bench.compare before.json after.json --threshold 10
+"""
+import argparse
+import json
+
+METRICS = ['throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms']
+
+
+def change(before, after):
+    if not before:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(before, after, threshold):
+    """Rows of (phase, route, metric, before, after, change %, regressed)"""
+    rows = []
+    for phase, old_phase in before['phases'].items():
+        new_phase = after['phases'].get(phase)
+        if not new_phase:
+            continue
+        for route, old in old_phase['routes'].items():
+            new = new_phase['routes'].get(route)
+            if not new:
+                continue
+            for metric in METRICS:
+                delta = change(old[metric], new[metric])
+                # Lower latency is better, higher throughput is better
+                worse = delta is not None and (-delta if metric == 'throughput_rps' else delta) > threshold
+                rows.append((phase, route, metric, old[metric], new[metric], delta, worse))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10, help='percent change that counts as a regression')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    print(f"before: {before.get('revision')}  after: {after.get('revision')}")
+    if before.get('dataset') != after.get('dataset'):
+        print(f"warning: datasets differ ({before.get('dataset')} vs {after.get('dataset')})")
+    rows = compare(before, after, args.threshold)
+    for phase, route, metric, old, new, delta, worse in rows:
+        shown = 'n/a' if delta is None else f'{delta:+.1f}%'
+        print(f"{phase:<20} {route:<18} {metric:<15} {old:>10} {new:>10} {shown:>9}{'  REGRESSION' if worse else ''}")
+
+    regressions = [row for row in rows if row[-1]]
+    if regressions:
+        raise SystemExit(f'{len(regressions)} metrics regressed by more than {args.threshold}%')
+
+
+if __name__ == '__main__':
+    main()
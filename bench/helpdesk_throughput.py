@@ -0,0 +1,78 @@
+"""Help desk answers per second as the FAQ corpus grows.
+
+Pads the shipped FAQ with synthetic entries and times HelpDesk.answer()
+against the old first-substring-match scan on the same messages:
+
+    python -m bench.helpdesk_throughput --entries 100 1000 10000 --messages 2000
+"""
+import argparse
+import json
+import random
+import time
+
+from helpdesk import FAQ_PATH, HelpDesk
+
+MESSAGES = [
+    'hi', 'where can I see my grades', 'how do I appeal a grade', 'I forgot my password',
+    'what are the office hours', 'how do I drop a course', 'my timetable has a clash',
+    'who do I contact for urgent support', 'when is the fee payment deadline', 'this is weird',
+]
+
+
+def synthetic_corpus(size, seed=0):
+    with open(FAQ_PATH, encoding='utf-8') as f:
+        corpus = json.load(f)
+    rng = random.Random(seed)
+    vocabulary = [f'topic{i}' for i in range(size * 2)]
+    padding = []
+    for i in range(max(0, size - len(corpus['entries']))):
+        words = rng.sample(vocabulary, 4)
+        padding.append({
+            'keywords': [words[0], words[1], f'{words[2]} {words[3]}'],
+            'answer': f'Synthetic answer {i}',
+        })
+    # Real entries last, as they would be once the FAQ has grown around them
+    return padding + corpus['entries'], corpus['fallback']
+
+
+def substring_scan(entries, fallback, message):
+    """The previous matcher: first keyword found anywhere in the message"""
+    message = message.lower()
+    for entry in entries:
+        for keyword in entry['keywords']:
+            if keyword in message:
+                return entry['answer']
+    return fallback
+
+
+def answers_per_second(answer, messages):
+    started = time.perf_counter()
+    for message in messages:
+        answer(message)
+    return len(messages) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--messages', type=int, default=2000, help='messages answered per setting')
+    args = parser.parse_args()
+
+    messages = [MESSAGES[i % len(MESSAGES)] for i in range(args.messages)]
+    results = []
+    for size in args.entries:
+        entries, fallback = synthetic_corpus(size)
+        started = time.perf_counter()
+        helpdesk = HelpDesk(entries, fallback)
+        build = time.perf_counter() - started
+        results.append({
+            'entries': len(entries),
+            'index_build_ms': round(build * 1000, 1),
+            'indexed_per_s': round(answers_per_second(helpdesk.answer, messages)),
+            'substring_scan_per_s': round(answers_per_second(lambda m: substring_scan(entries, fallback, m), messages)),
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import hashlib
+import json
+
+# Faculty codes and their display names, in the order the forms list them
+FACULTIES = {
+    'FCIT': 'Faculty of Computer & Information Technology',
+    'FBBA': 'Faculty of Business & Business Administration',
+    'FENG': 'Faculty of Engineering',
+    'FMED': 'Faculty of Health science',
+    'FSCI': 'Faculty of Social Science',
+    'FART': 'Faculty of Arts',
+    'FLAW': 'Faculty of Law',
+    'FEDU': 'Faculty of Education',
+}
+
+FACULTY_MAJORS = {
+    'FCIT': ['Computer Science', 'Information Technology', 'Software Engineering', 
+            'Cybersecurity', 'Data Science', 'Artificial Intelligence', 
+            'Computer Engineering', 'Network Engineering'],
+    'FBBA': ['Business Administration', 'Accounting', 'Finance', 'Marketing', 
+            'Human Resources', 'International Business', 'Management', 'Entrepreneurship'],
+    'FENG': ['Electrical Engineering', 'Mechanical Engineering', 'Civil Engineering', 
+            'Chemical Engineering', 'Industrial Engineering', 'Biomedical Engineering'],
+    'FMED': ['Nursing', 'midwifery', 'Pharmacy', 'Nutrition', 'Public Health', 'Medical laborotary'],
+    'FSCI': ['Social work', 'Public administration', 'International relationship', 'Development study', 'Political science'],
+    'FART': ['Psychology', 'Sociology', 'English Literature', 'History', 
+            'Political Science', 'International Relations'],
+    'FLAW': ['Law', 'Criminal Justice'],
+    'FEDU': ['Education', 'Early Childhood Education']
+}
+
+# Built once at import: the forms' view of the catalog and its JSON document
+CATALOG = [
+    {'code': code, 'name': name, 'majors': FACULTY_MAJORS.get(code, [])}
+    for code, name in FACULTIES.items()
+]
+CATALOG_JSON = json.dumps({'faculties': CATALOG}, separators=(',', ':'), sort_keys=True).encode('utf-8')
+# Changes whenever the catalog does, so its URL can be cached indefinitely
+CATALOG_VERSION = hashlib.sha1(CATALOG_JSON).hexdigest()[:12]
+
+
+def get_majors_by_faculty(faculty):
+    """Get majors based on selected faculty"""
+    return FACULTY_MAJORS.get(faculty, [])
@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from collections import deque
+
+from mysql.connector import Error
+
+from querylog import InstrumentedCursor
+
+
+class PoolTimeout(Error):
+    """Raised when no connection becomes free before the checkout timeout"""
+
+
+class PooledConnection:
+    """Wraps a raw database connection so that close() hands it back to the pool"""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._closed = False
+
+    def cursor(self, *args, **kwargs):
+        """A cursor whose statements are timed into the current request's query log"""
+        return InstrumentedCursor(self._raw.cursor(*args, **kwargs))
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._pool._release(self._raw)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class ConnectionPool:
+    """Bounded pool of database connections opened by connect().
+
+    The pool lives in one process, so with gunicorn every worker gets its own
+    pool and the database sees at most workers * size connections.
+    """
+
+    def __init__(self, connect, size=5, timeout=5.0, validate_after=1.0):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.validate_after = validate_after
+        self._cond = threading.Condition()
+        self._init_state()
+
+    def _init_state(self):
+        self._pid = os.getpid()
+        self._idle = deque()
+        self._created = 0
+        self.counters = {
+            'checkouts': 0,
+            'hits': 0,
+            'misses': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'discarded': 0,
+            'resets': 0,
+        }
+
+    def get_connection(self):
+        """Check out a connection, waiting up to self.timeout seconds for one to free up"""
+        with self._cond:
+            # A forked worker must not reuse sockets opened by its parent
+            if self._pid != os.getpid():
+                self._init_state()
+
+            deadline = time.monotonic() + self.timeout
+            waited = False
+            while True:
+                if self._idle:
+                    raw, last_used = self._idle.pop()
+                    self.counters['hits'] += 1
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    raw, last_used = None, None
+                    self.counters['misses'] += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout(msg=f"No database connection free after {self.timeout}s")
+                if not waited:
+                    self.counters['waits'] += 1
+                    waited = True
+                self._cond.wait(remaining)
+
+            self.counters['checkouts'] += 1
+
+        if raw is not None and time.monotonic() - last_used >= self.validate_after:
+            if not self._is_alive(raw):
+                # The slot stays checked out and is refilled below, so no other
+                # thread can take it while the dead connection is swapped out
+                self._close(raw)
+                with self._cond:
+                    self.counters['discarded'] += 1
+                    self.counters['misses'] += 1
+                # One dead connection usually means the server restarted or
+                # dropped us, so every idle connection is suspect
+                self._reset()
+                raw = None
+
+        if raw is None:
+            try:
+                raw = self.connect()
+            except Error:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+
+        return PooledConnection(self, raw)
+
+    def _is_alive(self, raw):
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Error:
+            return False
+
+    def _release(self, raw):
+        try:
+            if raw.unread_result:
+                raw.consume_results()
+            if raw.in_transaction:
+                raw.rollback()
+        except Error:
+            self._discard(raw)
+            return
+
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            self._idle.append((raw, time.monotonic()))
+            self._cond.notify()
+
+    def _close(self, raw):
+        try:
+            raw.close()
+        except Error:
+            pass
+
+    def _discard(self, raw):
+        self._close(raw)
+        with self._cond:
+            self._created -= 1
+            self.counters['discarded'] += 1
+            self._cond.notify()
+
+    def _reset(self):
+        """Close every idle connection so the next checkouts open fresh ones"""
+        with self._cond:
+            stale = [raw for raw, _ in self._idle]
+            self._idle.clear()
+            self.counters['resets'] += 1
+        for raw in stale:
+            self._discard(raw)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self.counters)
+            stats['size'] = self.size
+            stats['open'] = self._created
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._created - len(self._idle)
+        return stats
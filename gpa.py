@@ -0,0 +1,210 @@
+import os
+
+# Points per letter grade; F earns no credit
+GRADE_POINTS = {
+    'A': 4.0, 'A-': 3.7,
+    'B+': 3.3, 'B': 3.0, 'B-': 2.7,
+    'C+': 2.3, 'C': 2.0, 'C-': 1.7,
+    'D+': 1.3, 'D': 1.0,
+    'F': 0.0,
+}
+
+# Term GPA and load needed for the dean's list
+DEANS_LIST_GPA = float(os.environ.get('DEANS_LIST_GPA', 3.5))
+DEANS_LIST_MIN_CREDITS = int(os.environ.get('DEANS_LIST_MIN_CREDITS', 12))
+# Cumulative GPA below which a student is on academic probation
+PROBATION_GPA = float(os.environ.get('PROBATION_GPA', 2.0))
+
+# Chronological order of semesters within an academic year
+SEMESTER_ORDER = ('Winter', 'Spring', 'Summer', 'Fall')
+
+
+def term_order(column='semester'):
+    """SQL expression sorting a semester column chronologically"""
+    return f"FIELD({column}, {', '.join(repr(semester) for semester in SEMESTER_ORDER)})"
+
+
+GPA_TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS grade_points (
+        grade VARCHAR(5) PRIMARY KEY,
+        points DECIMAL(3,2) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS term_gpa (
+        student_id INT NOT NULL,
+        academic_year VARCHAR(20) NOT NULL,
+        semester VARCHAR(50) NOT NULL,
+        credits_attempted INT NOT NULL,
+        credits_earned INT NOT NULL,
+        quality_points DECIMAL(8,2) NOT NULL,
+        gpa DECIMAL(3,2) NOT NULL,
+        PRIMARY KEY (student_id, academic_year, semester),
+        INDEX idx_term_gpa_term (academic_year, semester, gpa),
+        FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS student_gpa (
+        student_id INT PRIMARY KEY,
+        credits_attempted INT NOT NULL,
+        credits_earned INT NOT NULL,
+        quality_points DECIMAL(9,2) NOT NULL,
+        gpa DECIMAL(3,2) NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        INDEX idx_student_gpa_gpa (gpa),
+        FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE
+    )
+    """,
+]
+
+# Per-term sums over graded courses; grades with no points entry are ignored
+TERM_SUMS = """
+    SELECT g.student_id, g.academic_year, g.semester,
+           SUM(c.credits), SUM(IF(p.points > 0, c.credits, 0)), SUM(p.points * c.credits),
+           COALESCE(ROUND(SUM(p.points * c.credits) / NULLIF(SUM(c.credits), 0), 2), 0)
+    FROM grades g
+    JOIN courses c ON c.id = g.course_id
+    JOIN grade_points p ON p.grade = g.grade
+"""
+
+STUDENT_SUMS = """
+    SELECT t.student_id, SUM(t.credits_attempted), SUM(t.credits_earned), SUM(t.quality_points),
+           COALESCE(ROUND(SUM(t.quality_points) / NULLIF(SUM(t.credits_attempted), 0), 2), 0)
+    FROM term_gpa t
+"""
+
+UPSERT_TERM = """
+    INSERT INTO term_gpa (student_id, academic_year, semester, credits_attempted, credits_earned, quality_points, gpa)
+    {select}
+    ON DUPLICATE KEY UPDATE credits_attempted = VALUES(credits_attempted), credits_earned = VALUES(credits_earned),
+        quality_points = VALUES(quality_points), gpa = VALUES(gpa)
+"""
+
+UPSERT_STUDENT = """
+    INSERT INTO student_gpa (student_id, credits_attempted, credits_earned, quality_points, gpa)
+    {select}
+    ON DUPLICATE KEY UPDATE credits_attempted = VALUES(credits_attempted), credits_earned = VALUES(credits_earned),
+        quality_points = VALUES(quality_points), gpa = VALUES(gpa)
+"""
+
+
+def create_gpa_tables(cursor):
+    for table in GPA_TABLES:
+        cursor.execute(table)
+    cursor.executemany(
+        "INSERT INTO grade_points (grade, points) VALUES (%s, %s) ON DUPLICATE KEY UPDATE points = VALUES(points)",
+        list(GRADE_POINTS.items())
+    )
+
+
+def refresh_term(cursor, student_id, academic_year, semester):
+    """Re-sum one student's term after a single grade changed, then their cumulative GPA.
+
+    Touches only that term's handful of grade rows and the student's term
+    rows, so it is cheap enough to run inside every grade write.
+    """
+    cursor.execute(
+        UPSERT_TERM.format(select=TERM_SUMS + " WHERE g.student_id = %s AND g.academic_year = %s AND g.semester = %s"
+                           " GROUP BY g.student_id, g.academic_year, g.semester"),
+        (student_id, academic_year, semester)
+    )
+    if cursor.rowcount == 0:
+        # The term's last grade was deleted
+        cursor.execute(
+            "DELETE FROM term_gpa WHERE student_id = %s AND academic_year = %s AND semester = %s"
+            " AND NOT EXISTS (SELECT 1 FROM grades WHERE student_id = %s AND academic_year = %s AND semester = %s)",
+            (student_id, academic_year, semester, student_id, academic_year, semester)
+        )
+    cursor.execute(UPSERT_STUDENT.format(select=STUDENT_SUMS + " WHERE t.student_id = %s GROUP BY t.student_id"), (student_id,))
+    cursor.execute(
+        "DELETE FROM student_gpa WHERE student_id = %s AND NOT EXISTS (SELECT 1 FROM term_gpa WHERE student_id = %s)",
+        (student_id, student_id)
+    )
+
+
+def recompute(cursor, student_ids=None, enrollment_year=None, major=None):
+    """Rebuild the aggregates for a set of students in four set-based statements.
+
+    With no arguments every student is recomputed; otherwise the set is the
+    given ids and/or a cohort by enrollment year and major. Returns the
+    number of students that have grades.
+    """
+    conditions = []
+    params = []
+    if student_ids is not None:
+        if not student_ids:
+            return 0
+        conditions.append(f"s.id IN ({', '.join(['%s'] * len(student_ids))})")
+        params += list(student_ids)
+    if enrollment_year is not None:
+        conditions.append("s.enrollment_year = %s")
+        params.append(enrollment_year)
+    if major is not None:
+        conditions.append("s.major = %s")
+        params.append(major)
+    where = ' AND '.join(conditions) or '1 = 1'
+
+    # Single-table DELETEs with a subquery work on every backend; MySQL runs them as a semi-join
+    students = f"SELECT s.id FROM students s WHERE {where}"
+    cursor.execute(f"DELETE FROM term_gpa WHERE student_id IN ({students})", params)
+    cursor.execute(
+        UPSERT_TERM.format(select=TERM_SUMS + f" JOIN students s ON s.id = g.student_id WHERE {where}"
+                           " GROUP BY g.student_id, g.academic_year, g.semester"),
+        params
+    )
+    cursor.execute(f"DELETE FROM student_gpa WHERE student_id IN ({students})", params)
+    cursor.execute(
+        UPSERT_STUDENT.format(select=STUDENT_SUMS + f" JOIN students s ON s.id = t.student_id WHERE {where} GROUP BY t.student_id"),
+        params
+    )
+    return cursor.rowcount
+
+
+def student_summary(cursor, student_id):
+    """Cumulative totals and per-term rows, newest term first, from the aggregates"""
+    cursor.execute(
+        "SELECT credits_attempted, credits_earned, gpa FROM student_gpa WHERE student_id = %s",
+        (student_id,)
+    )
+    summary = cursor.fetchone()
+    cursor.execute(
+        f"SELECT academic_year, semester, credits_attempted, credits_earned, gpa FROM term_gpa"
+        f" WHERE student_id = %s ORDER BY academic_year DESC, {term_order()} DESC",
+        (student_id,)
+    )
+    return summary, cursor.fetchall()
+
+
+def deans_list(cursor, academic_year, semester, enrollment_year=None, major=None):
+    """Students whose term GPA and load qualify for the dean's list, best first"""
+    conditions = ["t.academic_year = %s", "t.semester = %s", "t.gpa >= %s", "t.credits_attempted >= %s"]
+    params = [academic_year, semester, DEANS_LIST_GPA, DEANS_LIST_MIN_CREDITS]
+    return _report(cursor, 'term_gpa', conditions, params, enrollment_year, major, 't.gpa DESC')
+
+
+def probation_list(cursor, enrollment_year=None, major=None):
+    """Students whose cumulative GPA is below PROBATION_GPA, lowest first"""
+    conditions = ["t.gpa < %s", "t.credits_attempted > 0"]
+    params = [PROBATION_GPA]
+    return _report(cursor, 'student_gpa', conditions, params, enrollment_year, major, 't.gpa ASC')
+
+
+def _report(cursor, table, conditions, params, enrollment_year, major, order):
+    if enrollment_year is not None:
+        conditions.append("s.enrollment_year = %s")
+        params.append(enrollment_year)
+    if major is not None:
+        conditions.append("s.major = %s")
+        params.append(major)
+    cursor.execute(
+        f"""SELECT s.id, s.university_id, s.first_name, s.last_name, s.major, s.enrollment_year,
+               t.gpa, t.credits_attempted, t.credits_earned
+        FROM {table} t
+        JOIN students s ON s.id = t.student_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY {order}, s.university_id""",
+        params
+    )
+    return cursor.fetchall()
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+
+# Grades the assign form offers
+VALID_GRADES = ['A', 'A-', 'B+', 'B', 'B-', 'C+', 'C', 'C-', 'D+', 'D', 'F']
+SEMESTERS = ['Fall', 'Spring', 'Summer', 'Winter']
+# Columns of an upload; course_code, semester and academic_year may come from the form instead
+GRADE_COLUMNS = ['university_id', 'course_code', 'grade', 'semester', 'academic_year']
+
+
+def read_grade_rows(upload, filename):
+    """(line or item number, row) pairs from an uploaded CSV or JSON file.
+
+    JSON may be a list of objects or an object with a 'grades' list.
+    """
+    if filename.lower().endswith('.json'):
+        data = json.load(upload)
+        items = data.get('grades', []) if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            raise ValueError("The JSON file must hold a list of grades")
+        for number, item in enumerate(items, start=1):
+            yield number, {str(key).strip().lower(): str(value) for key, value in item.items()} if isinstance(item, dict) else {}
+        return
+
+    reader = csv.DictReader(io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''))
+    if reader.fieldnames is None:
+        raise ValueError('The CSV file is empty')
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    for column in ('university_id', 'grade'):
+        if column not in reader.fieldnames:
+            raise ValueError(f"The CSV file is missing the {column} column")
+    for row in reader:
+        yield reader.line_num, row
+
+
+def clean_grade_row(row, defaults):
+    """Normalize one uploaded grade, filling blanks from the form's defaults"""
+    grade = {}
+    for column in GRADE_COLUMNS:
+        value = (row.get(column) or '').strip() or defaults.get(column, '')
+        if not value:
+            raise ValueError(f"Missing {column}")
+        grade[column] = value
+    grade['university_id'] = grade['university_id'].upper()
+    grade['course_code'] = grade['course_code'].upper()
+    grade['grade'] = grade['grade'].upper()
+    grade['semester'] = grade['semester'].capitalize()
+    if grade['grade'] not in VALID_GRADES:
+        raise ValueError(f"Invalid grade {grade['grade']}")
+    if grade['semester'] not in SEMESTERS:
+        raise ValueError(f"Invalid semester {grade['semester']}")
+    if not grade['academic_year'].isdigit():
+        raise ValueError(f"Invalid academic year {grade['academic_year']}")
+    return grade
+
+
+def resolve_ids(cursor, grades):
+    """Map university IDs and course codes of a batch to ids, one query per table"""
+    university_ids = sorted({grade['university_id'] for grade in grades})
+    course_codes = sorted({grade['course_code'] for grade in grades})
+    cursor.execute(
+        f"SELECT university_id, id FROM students WHERE university_id IN ({', '.join(['%s'] * len(university_ids))})",
+        university_ids
+    )
+    students = {university_id.upper(): student_id for university_id, student_id in cursor.fetchall()}
+    cursor.execute(
+        f"SELECT course_code, id FROM courses WHERE course_code IN ({', '.join(['%s'] * len(course_codes))})",
+        course_codes
+    )
+    courses = {course_code.upper(): course_id for course_code, course_id in cursor.fetchall()}
+    return students, courses
@@ -0,0 +1,97 @@
+import json
+import math
+import os
+import re
+import threading
+
+# FAQ corpus; admins can add entries to this file without touching the code
+FAQ_PATH = os.environ.get('FAQ_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'faq.json'))
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def normalize(word):
+    """Fold simple plurals so 'grades' and 'grade' index together"""
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [normalize(word) for word in WORD_PATTERN.findall((text or '').lower())]
+
+
+class HelpDesk:
+    """FAQ answers ranked against a keyword index built once per corpus.
+
+    Every keyword, single word or phrase, is indexed under its first token,
+    so a message is matched in one pass over its words and only ever on
+    whole words. Each hit scores the summed rarity of the keyword's words
+    across the corpus, scaled by the entry's boost, and the entry with the
+    highest total wins; ties go to the entry listed first.
+    """
+
+    def __init__(self, entries, fallback):
+        self.entries = entries
+        self.fallback = fallback
+        self.index = {}
+
+        keywords = []
+        document_frequency = {}
+        for entry_id, entry in enumerate(entries):
+            phrases = {tuple(tokenize(keyword)) for keyword in entry['keywords']} - {()}
+            keywords.extend((tokens, entry_id) for tokens in phrases)
+            for token in {token for tokens in phrases for token in tokens}:
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+
+        total = len(entries) or 1
+        for tokens, entry_id in keywords:
+            weight = sum(1 + math.log(total / document_frequency[token]) for token in tokens)
+            weight *= self.entries[entry_id].get('boost', 1.0)
+            self.index.setdefault(tokens[0], []).append((tokens, entry_id, weight))
+        # Longest phrases first so 'grade appeal' is tried before 'grade'
+        for candidates in self.index.values():
+            candidates.sort(key=lambda candidate: -len(candidate[0]))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            corpus = json.load(f)
+        return cls(corpus['entries'], corpus['fallback'])
+
+    def rank(self, message):
+        """(score, entry_id) pairs for every entry the message matches, best first"""
+        tokens = tokenize(message)
+        scores = {}
+        position = 0
+        while position < len(tokens):
+            step = 1
+            for keyword, entry_id, weight in self.index.get(tokens[position], ()):
+                if tuple(tokens[position:position + len(keyword)]) == keyword:
+                    scores[entry_id] = scores.get(entry_id, 0) + weight
+                    step = max(step, len(keyword))
+            position += step
+        return sorted(((score, entry_id) for entry_id, score in scores.items()), key=lambda pair: (-pair[0], pair[1]))
+
+    def answer(self, message):
+        ranked = self.rank(message)
+        if not ranked:
+            return self.fallback
+        return self.entries[ranked[0][1]]['answer']
+
+
+_lock = threading.Lock()
+_helpdesk = None
+_loaded_mtime = None
+
+
+def get_helpdesk():
+    """The help desk for FAQ_PATH, rebuilt only when the file changes"""
+    global _helpdesk, _loaded_mtime
+    mtime = os.stat(FAQ_PATH).st_mtime
+    if _helpdesk is None or mtime != _loaded_mtime:
+        with _lock:
+            if _helpdesk is None or mtime != _loaded_mtime:
+                _helpdesk = HelpDesk.load(FAQ_PATH)
+                _loaded_mtime = mtime
+    return _helpdesk
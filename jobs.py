@@ -0,0 +1,311 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from mysql.connector import Error
+
+import querylog
+
+JOBS_TABLE = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    payload TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    last_error TEXT,
+    run_after DATETIME NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    started_at DATETIME NULL,
+    heartbeat_at DATETIME NULL,
+    finished_at DATETIME NULL,
+    INDEX idx_jobs_due (status, run_after),
+    INDEX idx_jobs_kind (kind, status)
+)
+"""
+
+
+class JobQueue:
+    """In-process background job runner backed by the jobs table.
+
+    Jobs are written to the table before they are handed to the worker
+    threads, so a job that is lost with a restarted worker is picked up again
+    by the sweeper of any other worker. A job is claimed with a conditional
+    UPDATE, so it only ever runs in one place at a time.
+
+    While a job runs, the sweeper of its process refreshes heartbeat_at, and
+    only a job whose heartbeat is stale_after seconds old is taken back, so
+    long jobs are not run twice. A job whose worker died mid-run is run
+    again from the start, so handlers must be idempotent: safe to re-run
+    after a partial run.
+    """
+
+    def __init__(self, get_connection, workers=2, max_attempts=5, backoff=2.0,
+                 poll_interval=5.0, sweep_after=10, stale_after=120, max_depth=1000):
+        self.get_connection = get_connection
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.sweep_after = sweep_after
+        self.stale_after = stale_after
+        self.handlers = {}
+        self.periodic = {}
+        self._queue = queue.Queue(maxsize=max_depth)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._running = 0
+        # job id -> attempt number of the jobs this process is running
+        self._active = {}
+        self._kind_stats = {}
+
+    def handler(self, kind):
+        """Register the decorated function as the handler for jobs of this kind"""
+        def decorator(f):
+            self.handlers[kind] = f
+            return f
+        return decorator
+
+    def every(self, kind, seconds):
+        """Have the sweeper enqueue a job of this kind every so many seconds"""
+        self.periodic[kind] = seconds
+
+    def enqueue(self, kind, cursor=None, **payload):
+        """Persist a job and return its id.
+
+        Pass the request's cursor to write the job in the same transaction as
+        the data it works on, then call dispatch() once that is committed.
+        Without a cursor the job is committed and dispatched straight away.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+
+        sql = (
+            "INSERT INTO jobs (kind, payload, status, run_after) "
+            "VALUES (%s, %s, 'pending', NOW() + INTERVAL %s SECOND)"
+        )
+        params = (kind, json.dumps(payload), self.sweep_after)
+        if cursor is not None:
+            cursor.execute(sql, params)
+            return cursor.lastrowid
+
+        connection = self.get_connection()
+        if not connection:
+            raise Error(msg='Database connection error')
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql, params)
+            job_id = cursor.lastrowid
+            connection.commit()
+        finally:
+            connection.close()
+        self.dispatch(job_id)
+        return job_id
+
+    def dispatch(self, *job_ids):
+        """Hand committed jobs to the worker threads"""
+        self.start()
+        for job_id in job_ids:
+            try:
+                self._queue.put_nowait((job_id, time.time()))
+            except queue.Full:
+                # Still pending in the table; the sweeper will get to it
+                pass
+
+    def start(self):
+        """Start the worker and sweeper threads once per process"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._running = 0
+            self._active = {}
+
+        self._ensure_table()
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True).start()
+        threading.Thread(target=self._sweep, name='job-sweeper', daemon=True).start()
+
+    def _ensure_table(self):
+        connection = self.get_connection()
+        if connection:
+            try:
+                connection.cursor().execute(JOBS_TABLE)
+                connection.commit()
+            except Error as e:
+                print(f"Error creating jobs table: {e}")
+            finally:
+                connection.close()
+
+    def _sweep(self):
+        """Requeue due jobs: retries whose backoff expired and jobs left behind by other workers"""
+        while True:
+            time.sleep(self.poll_interval)
+            connection = self.get_connection()
+            if not connection:
+                continue
+            try:
+                cursor = connection.cursor()
+                with self._lock:
+                    active = list(self._active.items())
+                for job_id, attempts in active:
+                    cursor.execute(
+                        "UPDATE jobs SET heartbeat_at = NOW() WHERE id = %s AND attempts = %s AND status = 'running'",
+                        (job_id, attempts)
+                    )
+                for kind, seconds in self.periodic.items():
+                    # Every worker runs this; the NOT EXISTS keeps it to roughly one job per period
+                    cursor.execute(
+                        "INSERT INTO jobs (kind, payload, status, run_after) "
+                        "SELECT %s, '{}', 'pending', NOW() FROM DUAL WHERE NOT EXISTS ("
+                        "SELECT 1 FROM jobs WHERE kind = %s AND (status IN ('pending', 'running') "
+                        "OR finished_at > NOW() - INTERVAL %s SECOND))",
+                        (kind, kind, seconds)
+                    )
+                # A running job whose heartbeat stopped belonged to a worker that died mid-job
+                cursor.execute(
+                    "UPDATE jobs SET status = 'pending' WHERE status = 'running' "
+                    "AND COALESCE(heartbeat_at, started_at) < NOW() - INTERVAL %s SECOND",
+                    (self.stale_after,)
+                )
+                cursor.execute(
+                    "SELECT id, UNIX_TIMESTAMP(created_at) FROM jobs WHERE status = 'pending' AND run_after <= NOW() ORDER BY run_after LIMIT %s",
+                    (max(1, self._queue.maxsize - self._queue.qsize()),)
+                )
+                due = cursor.fetchall()
+                connection.commit()
+            except Error as e:
+                print(f"Error sweeping jobs: {e}")
+                continue
+            finally:
+                connection.close()
+
+            for job_id, created_at in due:
+                try:
+                    self._queue.put_nowait((job_id, float(created_at)))
+                except queue.Full:
+                    break
+
+    def _work(self):
+        while True:
+            job_id, enqueued_at = self._queue.get()
+            with self._lock:
+                self._running += 1
+            try:
+                self._run(job_id, enqueued_at)
+            except Exception as e:
+                # Whatever went wrong, this thread must live on to run the next job
+                print(f"Error running job {job_id}: {e}")
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+    def _run(self, job_id, enqueued_at):
+        connection = self.get_connection()
+        if not connection:
+            return
+        try:
+            cursor = connection.cursor()
+            cursor.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = NOW(), heartbeat_at = NOW() "
+                "WHERE id = %s AND status = 'pending'",
+                (job_id,)
+            )
+            claimed = cursor.rowcount == 1
+            connection.commit()
+            if not claimed:
+                return
+            cursor.execute("SELECT kind, payload, attempts FROM jobs WHERE id = %s", (job_id,))
+            row = cursor.fetchone()
+        finally:
+            connection.close()
+        if row is None:
+            # Deleted between the claim and the read
+            return
+        kind, payload, attempts = row
+
+        started = time.time()
+        error = None
+        with self._lock:
+            self._active[job_id] = attempts
+        querylog.start(f'job {kind}')
+        try:
+            self.handlers[kind](**json.loads(payload))
+        except Exception as e:
+            error = e
+        finally:
+            querylog.finish()
+            with self._lock:
+                self._active.pop(job_id, None)
+        finished = time.time()
+
+        connection = self.get_connection()
+        if not connection:
+            return
+        try:
+            cursor = connection.cursor()
+            # Matching on attempts keeps a run whose job was taken back and
+            # claimed again from overwriting the newer run's status
+            if error is None:
+                cursor.execute(
+                    "UPDATE jobs SET status = 'done', finished_at = NOW(), last_error = NULL WHERE id = %s AND attempts = %s",
+                    (job_id, attempts)
+                )
+            elif attempts < self.max_attempts:
+                # Exponential backoff; the sweeper picks the job up once it is due
+                cursor.execute(
+                    "UPDATE jobs SET status = 'pending', last_error = %s, run_after = NOW() + INTERVAL %s SECOND "
+                    "WHERE id = %s AND attempts = %s",
+                    (str(error), int(self.backoff ** attempts), job_id, attempts)
+                )
+            else:
+                cursor.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = NOW(), last_error = %s WHERE id = %s AND attempts = %s",
+                    (str(error), job_id, attempts)
+                )
+            connection.commit()
+        finally:
+            connection.close()
+
+        if error is not None:
+            print(f"Job {job_id} ({kind}) failed on attempt {attempts}: {error}")
+        self._record(kind, error is None, finished - started, finished - enqueued_at)
+
+    def _record(self, kind, ok, run_time, latency):
+        with self._lock:
+            stats = self._kind_stats.setdefault(kind, {
+                'done': 0, 'errors': 0, 'run_seconds_total': 0.0, 'run_seconds_max': 0.0,
+                'latency_seconds_total': 0.0, 'latency_seconds_max': 0.0,
+            })
+            stats['done' if ok else 'errors'] += 1
+            stats['run_seconds_total'] += run_time
+            stats['run_seconds_max'] = max(stats['run_seconds_max'], run_time)
+            stats['latency_seconds_total'] += latency
+            stats['latency_seconds_max'] = max(stats['latency_seconds_max'], latency)
+
+    def stats(self):
+        """Queue depth and per-kind latency for this worker, plus job counts by status from the table"""
+        with self._lock:
+            stats = {
+                'workers': self.workers,
+                'queue_depth': self._queue.qsize(),
+                'running': self._running,
+                'kinds': {kind: dict(values) for kind, values in self._kind_stats.items()},
+            }
+
+        connection = self.get_connection()
+        if connection:
+            try:
+                cursor = connection.cursor()
+                cursor.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+                stats['table'] = dict(cursor.fetchall())
+            except Error as e:
+                print(f"Error loading job counts: {e}")
+            finally:
+                connection.close()
+        return stats
@@ -0,0 +1,277 @@
+import fcntl
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+# Where each gunicorn worker leaves its numbers so /metrics can report them all
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'portal_metrics'))
+# File in METRICS_DIR holding the counters and histograms of workers that have exited
+RETIRED_FILE = 'retired.json'
+# Seconds between a worker's snapshots; /metrics lags the other workers by up to this
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+# Upper bounds, in seconds, of the latency histogram buckets
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ACQUIRE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+# Upper bounds of the statements-per-request histogram buckets
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)
+BUCKETS = {
+    'portal_http_request_duration_seconds': REQUEST_BUCKETS,
+    'portal_db_connection_acquire_seconds': ACQUIRE_BUCKETS,
+    'portal_db_queries_per_request': QUERY_COUNT_BUCKETS,
+}
+
+HELP = {
+    'portal_http_requests_total': ('counter', 'Requests handled, by endpoint, method and status'),
+    'portal_http_request_duration_seconds': ('histogram', 'Time spent handling a request, by endpoint'),
+    'portal_http_requests_in_flight': ('gauge', 'Requests being handled right now, by endpoint'),
+    'portal_db_connection_acquire_seconds': ('histogram', 'Time spent checking a connection out of the pool'),
+    'portal_db_connection_errors_total': ('counter', 'Connection checkouts that failed or timed out'),
+    'portal_db_pool_connections': ('gauge', 'Pooled connections by state'),
+    'portal_db_queries_total': ('counter', 'SQL statements run, by endpoint'),
+    'portal_db_query_seconds_total': ('counter', 'Time spent running and fetching SQL statements, by endpoint'),
+    'portal_db_queries_per_request': ('histogram', 'SQL statements run by one request, by endpoint'),
+    'portal_db_slow_queries_total': ('counter', 'Statements slower than SLOW_QUERY_SECONDS, by endpoint'),
+    'portal_db_repeated_query_requests_total': ('counter', 'Requests that ran one statement shape more than REPEATED_QUERY_LIMIT times, by endpoint'),
+}
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _pid_of(path):
+    """The worker pid a snapshot file is named after, or None for any other file"""
+    try:
+        return int(os.path.basename(path)[:-len('.json')])
+    except ValueError:
+        return None
+
+
+def _merge(totals, snapshot):
+    """Add a snapshot into totals, kind -> name -> labels -> value or bucket counts"""
+    for kind, by_name in snapshot.items():
+        for name, series in by_name.items():
+            target = totals.setdefault(kind, {}).setdefault(name, {})
+            for labels, value in series:
+                labels = tuple(tuple(pair) for pair in labels)
+                if kind != 'histograms':
+                    target[labels] = target.get(labels, 0) + value
+                elif labels in target:
+                    target[labels] = [a + b for a, b in zip(target[labels], value)]
+                else:
+                    target[labels] = list(value)
+    return totals
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(round(value, 6)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Request and connection-pool metrics for one worker process.
+
+    Samples live in plain dicts keyed by metric name and label tuple. Each
+    worker writes a JSON snapshot to METRICS_DIR now and then, and the
+    worker that answers a scrape adds up the snapshots of every live
+    worker, so the numbers cover the whole gunicorn server whichever worker
+    Prometheus happens to reach. When a worker exits, its counters and
+    histograms are folded into RETIRED_FILE so the totals never go down,
+    which Prometheus would read as a reset; its gauges go with it.
+    """
+
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._collectors = []
+        self._init_state()
+
+    def _init_state(self):
+        self._pid = os.getpid()
+        self._flushed_at = 0.0
+        self.counters = {}
+        self.gauges = {}
+        # name -> labels -> [bucket counts..., +Inf count, sum]
+        self.histograms = {}
+
+    def _check_fork(self):
+        # A forked worker starts from zero rather than repeating its parent's numbers
+        if self._pid != os.getpid():
+            self._init_state()
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            self._check_fork()
+            series = self.counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def set(self, name, labels, value):
+        with self._lock:
+            self._check_fork()
+            self.gauges.setdefault(name, {})[labels] = value
+
+    def observe(self, name, labels, value):
+        buckets = BUCKETS[name]
+        with self._lock:
+            self._check_fork()
+            series = self.histograms.setdefault(name, {})
+            counts = series.get(labels)
+            if counts is None:
+                counts = series[labels] = [0] * (len(buckets) + 2)
+            counts[bisect_left(buckets, value)] += 1
+            counts[-1] += value
+
+    def collector(self, f):
+        """Register f to refresh gauges just before every snapshot"""
+        self._collectors.append(f)
+        return f
+
+    def request_started(self, endpoint):
+        self._add_in_flight(endpoint, 1)
+
+    def request_finished(self, endpoint, method, status, seconds):
+        self._add_in_flight(endpoint, -1)
+        self.inc('portal_http_requests_total', (('endpoint', endpoint), ('method', method), ('status', str(status))))
+        self.observe('portal_http_request_duration_seconds', (('endpoint', endpoint),), seconds)
+        self.maybe_flush()
+
+    def _add_in_flight(self, endpoint, delta):
+        labels = (('endpoint', endpoint),)
+        with self._lock:
+            self._check_fork()
+            series = self.gauges.setdefault('portal_http_requests_in_flight', {})
+            series[labels] = series.get(labels, 0) + delta
+
+    def request_queries(self, endpoint, log):
+        """Add up the statements of a finished request's query log"""
+        labels = (('endpoint', endpoint),)
+        self.inc('portal_db_queries_total', labels, log.count)
+        self.inc('portal_db_query_seconds_total', labels, log.seconds)
+        self.observe('portal_db_queries_per_request', labels, log.count)
+        self.inc('portal_db_slow_queries_total', labels, len(log.slow()))
+        if log.repeated():
+            self.inc('portal_db_repeated_query_requests_total', labels)
+
+    def connection_acquired(self, seconds, ok=True):
+        self.observe('portal_db_connection_acquire_seconds', (), seconds)
+        if not ok:
+            self.inc('portal_db_connection_errors_total')
+
+    def snapshot(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                'counters': {name: list(series.items()) for name, series in self.counters.items()},
+                'gauges': {name: list(series.items()) for name, series in self.gauges.items()},
+                'histograms': {name: [(labels, list(counts)) for labels, counts in series.items()]
+                               for name, series in self.histograms.items()},
+            }
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write this worker's snapshot where the other workers can read it"""
+        self._flushed_at = time.monotonic()
+        for collect in self._collectors:
+            collect(self)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            self._write(f'{os.getpid()}.json', self.snapshot())
+        except OSError as e:
+            print(f"Error writing metrics snapshot: {e}")
+
+    def _write(self, name, snapshot):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, os.path.join(self.directory, name))
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _worker_snapshots(self):
+        """Snapshots of the other live workers; files of workers that exited are retired"""
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            pid = _pid_of(path)
+            if pid is None or pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                self._retire(path)
+                continue
+            except PermissionError:
+                pass
+            snapshot = self._read(path)
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        return snapshots
+
+    def _retire(self, path):
+        """Fold an exited worker's counters and histograms into RETIRED_FILE; called under the directory lock"""
+        snapshot = self._read(path)
+        try:
+            if snapshot is not None:
+                totals = _merge({}, self._read(os.path.join(self.directory, RETIRED_FILE)) or {})
+                _merge(totals, {kind: snapshot.get(kind, {}) for kind in ('counters', 'histograms')})
+                self._write(RETIRED_FILE, {kind: {name: list(series.items()) for name, series in by_name.items()}
+                                           for kind, by_name in totals.items()})
+            os.remove(path)
+        except OSError as e:
+            print(f"Error retiring metrics snapshot {path}: {e}")
+
+    def _collect(self):
+        """The other workers' snapshots and the retired totals, read as of one moment"""
+        try:
+            # Scrapes take turns, so a dead worker is folded in once and never missed halfway through
+            with open(os.path.join(self.directory, 'retired.lock'), 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                snapshots = self._worker_snapshots()
+                return snapshots + [self._read(os.path.join(self.directory, RETIRED_FILE)) or {}]
+        except OSError as e:
+            print(f"Error reading metrics snapshots: {e}")
+            return []
+
+    def render(self):
+        """Every worker's metrics, summed, in the Prometheus text exposition format"""
+        self.flush()
+        totals = {'counters': {}, 'gauges': {}, 'histograms': {}}
+        for snapshot in [self.snapshot()] + self._collect():
+            _merge(totals, snapshot)
+        counters, gauges, histograms = totals['counters'], totals['gauges'], totals['histograms']
+
+        lines = []
+        for name, series in sorted(counters.items()) + sorted(gauges.items()):
+            kind, text = HELP.get(name, ('untyped', name))
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} {kind}']
+            for labels, value in sorted(series.items()):
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        for name, series in sorted(histograms.items()):
+            kind, text = HELP.get(name, ('histogram', name))
+            buckets = BUCKETS[name]
+            lines += [f'# HELP {name} {text}', f'# TYPE {name} {kind}']
+            for labels, counts in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(buckets + (float('inf'),), counts[:-1]):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", _number(float(bound))),))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(float(counts[-1]))}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,310 @@
+from mysql.connector import Error
+
+from gpa import create_gpa_tables, recompute
+from jobs import JOBS_TABLE
+from storage import dialect
+
+MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INT PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+# Seconds a worker waits for another one that is already migrating
+LOCK_TIMEOUT = 60
+
+MIGRATIONS = []
+
+
+def migration(version, name):
+    """Register the decorated function as schema migration number version"""
+    def decorator(f):
+        MIGRATIONS.append((version, name, f))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return f
+    return decorator
+
+
+def column_exists(cursor, table, column):
+    if dialect(cursor) == 'sqlite':
+        cursor.execute("SELECT COUNT(*) FROM pragma_table_info(%s) WHERE name = %s", (table, column))
+        return cursor.fetchone()[0] > 0
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s",
+        (table, column)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def index_exists(cursor, table, index):
+    if dialect(cursor) == 'sqlite':
+        cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'index' AND tbl_name = %s AND name = %s", (table, index))
+        return cursor.fetchone()[0] > 0
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s",
+        (table, index)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+# MySQL commits DDL implicitly, so every step checks before it changes
+# anything and a migration that failed half way can simply be run again
+
+def add_column(cursor, table, column, definition):
+    if not column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+def modify_column(cursor, table, column, definition):
+    # SQLite columns take any type, and its databases never had the old setup script's schema
+    if dialect(cursor) != 'sqlite' and column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} MODIFY COLUMN {column} {definition}")
+
+
+def add_index(cursor, table, index, columns, unique=False):
+    if not index_exists(cursor, table, index):
+        cursor.execute(f"ALTER TABLE {table} ADD {'UNIQUE ' if unique else ''}INDEX {index} ({columns})")
+
+
+@migration(1, 'base tables')
+def create_base_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS students (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            university_id VARCHAR(20) NOT NULL,
+            faculty VARCHAR(10) NOT NULL,
+            first_name VARCHAR(100) NOT NULL,
+            last_name VARCHAR(100) NOT NULL,
+            email VARCHAR(255) UNIQUE NOT NULL,
+            phone_number VARCHAR(20),
+            password VARCHAR(255) NOT NULL,
+            major VARCHAR(100),
+            enrollment_year INT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY uq_students_university_id (university_id)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS courses (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            course_code VARCHAR(20) UNIQUE NOT NULL,
+            course_name VARCHAR(255) NOT NULL,
+            instructor VARCHAR(100) NOT NULL,
+            schedule_days VARCHAR(50) NOT NULL,
+            schedule_time VARCHAR(50) NOT NULL,
+            credits INT NOT NULL,
+            max_capacity INT NOT NULL,
+            current_enrollment INT DEFAULT 0,
+            program VARCHAR(255),
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS registrations (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            student_id INT NOT NULL,
+            course_id INT NOT NULL,
+            semester VARCHAR(50) NOT NULL,
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE,
+            FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE,
+            UNIQUE KEY unique_registration (student_id, course_id, semester)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS grades (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            student_id INT NOT NULL,
+            course_id INT NOT NULL,
+            grade VARCHAR(5) NOT NULL,
+            semester VARCHAR(50) NOT NULL,
+            academic_year VARCHAR(20) NOT NULL,
+            assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE,
+            FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS announcements (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            title VARCHAR(255) NOT NULL,
+            content TEXT NOT NULL,
+            author VARCHAR(100) NOT NULL,
+            is_important BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+@migration(2, 'student and course columns used by the app')
+def add_app_columns(cursor):
+    # Databases made by the old setup script keyed students on a generated
+    # student_id built from faculty_code/session_type/numeric_id
+    add_column(cursor, 'students', 'university_id', 'VARCHAR(20) NULL AFTER id')
+    add_column(cursor, 'students', 'faculty', 'VARCHAR(10) NULL AFTER university_id')
+    add_column(cursor, 'students', 'phone_number', 'VARCHAR(20) NULL AFTER email')
+    if column_exists(cursor, 'students', 'faculty_code'):
+        cursor.execute("UPDATE students SET university_id = student_id WHERE university_id IS NULL")
+        cursor.execute("UPDATE students SET faculty = faculty_code WHERE faculty IS NULL")
+    modify_column(cursor, 'students', 'faculty_code', 'VARCHAR(10) NULL')
+    modify_column(cursor, 'students', 'session_type', 'VARCHAR(1) NULL')
+    modify_column(cursor, 'students', 'numeric_id', 'INT NULL')
+    add_index(cursor, 'students', 'uq_students_university_id', 'university_id', unique=True)
+    add_column(cursor, 'courses', 'description', 'TEXT NULL')
+
+
+@migration(3, 'counters, statistics snapshots and jobs')
+def create_app_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS counters (
+            name VARCHAR(50) NOT NULL,
+            shard INT NOT NULL,
+            value BIGINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (name, shard)
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stats_snapshots (
+            name VARCHAR(50) PRIMARY KEY,
+            payload MEDIUMTEXT NOT NULL,
+            computed_at DATETIME NOT NULL
+        )
+    """)
+    cursor.execute(JOBS_TABLE)
+
+
+@migration(4, 'indexes for the hot queries')
+def add_hot_query_indexes(cursor):
+    # Student grade pages, the admin grade filters and the term list
+    add_index(cursor, 'grades', 'idx_grades_student_term', 'student_id, academic_year, semester')
+    add_index(cursor, 'grades', 'idx_grades_course_term', 'course_id, academic_year, semester')
+    add_index(cursor, 'grades', 'idx_grades_term', 'academic_year, semester')
+    # Newest-first announcements
+    add_index(cursor, 'announcements', 'idx_announcements_created', 'created_at')
+    # Program enrollment joins courses to students on program = major
+    add_index(cursor, 'courses', 'idx_courses_program', 'program')
+    add_index(cursor, 'students', 'idx_students_major_year', 'major, enrollment_year')
+    # Admin student listing: keyset on (created_at, id), optionally by faculty
+    add_index(cursor, 'students', 'idx_students_created', 'created_at, id')
+    add_index(cursor, 'students', 'idx_students_faculty_created', 'faculty, created_at')
+
+
+@migration(5, 'one grade per student, course and term')
+def add_unique_grades(cursor):
+    if not index_exists(cursor, 'grades', 'uq_grades_student_course_term'):
+        # Keep the most recent of any duplicates left by the old SELECT-then-INSERT
+        if dialect(cursor) == 'sqlite':
+            cursor.execute("""
+                DELETE FROM grades WHERE EXISTS (
+                    SELECT 1 FROM grades newer WHERE newer.student_id = grades.student_id AND newer.course_id = grades.course_id
+                        AND newer.academic_year = grades.academic_year AND newer.semester = grades.semester AND newer.id > grades.id
+                )
+            """)
+        else:
+            cursor.execute("""
+                DELETE g FROM grades g
+                JOIN grades newer ON newer.student_id = g.student_id AND newer.course_id = g.course_id
+                    AND newer.academic_year = g.academic_year AND newer.semester = g.semester AND newer.id > g.id
+            """)
+    add_index(cursor, 'grades', 'uq_grades_student_course_term', 'student_id, course_id, academic_year, semester', unique=True)
+
+
+@migration(6, 'grade point aggregates')
+def add_gpa_aggregates(cursor):
+    create_gpa_tables(cursor)
+    recompute(cursor)
+
+
+@migration(7, 'transcript cache versions')
+def add_grades_version(cursor):
+    add_column(cursor, 'students', 'grades_version', 'INT NOT NULL DEFAULT 0')
+
+
+@migration(8, 'job heartbeats')
+def add_job_heartbeats(cursor):
+    add_column(cursor, 'jobs', 'heartbeat_at', 'DATETIME NULL AFTER started_at')
+
+
+def applied_versions(cursor):
+    cursor.execute(MIGRATIONS_TABLE)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def pending_migrations(cursor):
+    applied = applied_versions(cursor)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def migrate(connection):
+    """Apply every pending migration in order and return the versions applied.
+
+    Workers that start together take turns on a named lock, so each
+    migration runs once and the others find nothing left to do.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT GET_LOCK('schema_migrations', %s)", (LOCK_TIMEOUT,))
+    if cursor.fetchone()[0] != 1:
+        raise Error(msg='Timed out waiting for another worker to finish migrating')
+    try:
+        applied = []
+        for version, name, apply in pending_migrations(cursor):
+            apply(cursor)
+            cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+            connection.commit()
+            applied.append(version)
+            print(f"Applied migration {version}: {name}")
+        return applied
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK('schema_migrations')")
+        cursor.fetchall()
+
+
+# (name, query, sample parameters) for the queries that run on every page
+# view or on registration day; none of them may scan a whole table
+HOT_QUERIES = [
+    ('login', "SELECT * FROM students WHERE university_id = %s", ('U0000000',)),
+    ('student courses', "SELECT c.* FROM courses c JOIN registrations r ON c.id = r.course_id WHERE r.student_id = %s", (1,)),
+    ('student timetable check', "SELECT course_id FROM registrations WHERE student_id = %s AND semester = %s", (1, 'Fall 2024')),
+    ('student grades',
+     "SELECT c.course_code, g.grade FROM grades g JOIN courses c ON g.course_id = c.id "
+     "WHERE g.student_id = %s ORDER BY g.academic_year DESC, g.semester DESC", (1,)),
+    ('latest announcements', "SELECT id, title FROM announcements ORDER BY created_at DESC LIMIT 10", ()),
+    ('program courses', "SELECT id FROM courses WHERE program = %s", ('Computer Science',)),
+    ('cohort', "SELECT id FROM students WHERE major = %s AND enrollment_year = %s", ('Computer Science', 2024)),
+    ('admin students page', "SELECT id, university_id FROM students ORDER BY created_at DESC, id DESC LIMIT 51", ()),
+    ('admin students by faculty',
+     "SELECT id, university_id FROM students WHERE faculty = %s ORDER BY created_at DESC, id DESC LIMIT 51", ('FCIT',)),
+    ('admin grades by term',
+     "SELECT id FROM grades WHERE academic_year = %s AND semester = %s ORDER BY id DESC LIMIT 51", ('2024', 'Fall')),
+    ('admin grades by course', "SELECT id FROM grades WHERE course_id = %s AND academic_year = %s", (1, '2024')),
+    ('due jobs', "SELECT id FROM jobs WHERE status = 'pending' AND run_after <= NOW() ORDER BY run_after LIMIT 10", ()),
+]
+
+
+def full_scans(cursor):
+    """(query name, table) for every hot query whose plan reads a whole table.
+
+    Run it against a database with realistic data: on near-empty tables the
+    optimizer may rightly prefer a scan to an index.
+    """
+    scans = []
+    for name, query, params in HOT_QUERIES:
+        if dialect(cursor) == 'sqlite':
+            # Plan rows read "SCAN <table>" for a full scan, "SCAN <table> USING INDEX ..." for an index walk
+            cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+            for row in cursor.fetchall():
+                words = row[-1].split()
+                if len(words) == 2 and words[0] == 'SCAN':
+                    scans.append((name, words[1]))
+            continue
+        cursor.execute(f"EXPLAIN {query}", params)
+        columns = [column[0] for column in cursor.description]
+        for row in cursor.fetchall():
+            plan = dict(zip(columns, row))
+            if plan.get('type') == 'ALL':
+                scans.append((name, plan.get('table')))
+    return scans
@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+
+import bcrypt
+
+# Work factor for new hashes; existing hashes are upgraded on the next login
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+# Threads that may run bcrypt at once in this worker
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', os.cpu_count() or 1))
+# Hashes allowed to wait or run at once before new ones are turned away
+HASH_QUEUE_LIMIT = int(os.environ.get('HASH_QUEUE_LIMIT', HASH_WORKERS * 4))
+# Longest a request waits for its hash before giving up
+HASH_TIMEOUT = float(os.environ.get('HASH_TIMEOUT', 5))
+# Processes used to hash passwords for bulk imports
+BULK_HASH_PROCESSES = int(os.environ.get('BULK_HASH_PROCESSES', os.cpu_count() or 1))
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing executor is over its CPU budget"""
+
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+_slots = threading.BoundedSemaphore(HASH_QUEUE_LIMIT)
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _lock:
+        if _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='bcrypt')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _run(fn, *args):
+    """Run fn on the hashing executor, refusing work beyond HASH_QUEUE_LIMIT"""
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = _get_executor().submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except TimeoutError:
+        raise HashingBusy()
+
+
+def hash_password(password, rounds=None):
+    salt = bcrypt.gensalt(rounds or BCRYPT_ROUNDS)
+    return _run(bcrypt.hashpw, password.encode('utf-8'), salt)
+
+
+def check_password(password, hashed):
+    return _run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def needs_rehash(hashed):
+    """True if hashed was made with a different work factor than BCRYPT_ROUNDS"""
+    try:
+        return int(hashed.split('$')[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def _hash_one(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds))
+
+
+def bulk_hasher():
+    """Process pool that hashes on every core; spawned, since the caller may be running threads"""
+    return ProcessPoolExecutor(max_workers=BULK_HASH_PROCESSES, mp_context=multiprocessing.get_context('spawn'))
+
+
+def hash_many(pool, passwords, rounds=None):
+    """Hash a batch of passwords on a bulk_hasher() pool, keeping their order"""
+    rounds = rounds or BCRYPT_ROUNDS
+    chunksize = max(1, len(passwords) // (BULK_HASH_PROCESSES * 4))
+    return list(pool.map(_hash_one, passwords, [rounds] * len(passwords), chunksize=chunksize))
@@ -0,0 +1,166 @@
+import glob
+import hashlib
+import hmac
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from uuid import uuid4
+
+# Where profiles are stored for download
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'portal_profiles'))
+# Fraction of all requests profiled without being asked, e.g. 0.001
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+# Seconds between stack samples of a profiled request
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+# Profiles kept on disk; the oldest are removed first
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+# Seconds a signed X-Profile-Token stays valid after it is issued
+PROFILE_TOKEN_TTL = int(os.environ.get('PROFILE_TOKEN_TTL', 3600))
+
+
+def _sign(secret, path, expires):
+    key = secret if isinstance(secret, bytes) else secret.encode('utf-8')
+    return hmac.new(key, f'profile:{path}:{expires}'.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def profile_token(secret, path, ttl=PROFILE_TOKEN_TTL):
+    """Value of the X-Profile-Token header that profiles requests to path for the next ttl seconds"""
+    expires = int(time.time() + ttl)
+    return f'{expires}.{_sign(secret, path, expires)}'
+
+
+def valid_token(secret, path, token):
+    """Whether token was signed with secret for path and has not expired; without a secret none is"""
+    if not secret or not token:
+        return False
+    expires, _, signature = token.partition('.')
+    try:
+        expires = int(expires)
+    except ValueError:
+        return False
+    return expires > time.time() and hmac.compare_digest(_sign(secret, path, expires), signature)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """Samples one thread's stack every interval seconds from a helper thread.
+
+    The profiled code runs untouched, so the cost is the sampling thread
+    taking the GIL briefly at each tick rather than a hook on every call.
+    Stacks are kept folded (root;...;leaf -> count), the input format of
+    flame graph tools.
+    """
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.seconds = time.perf_counter() - self.started
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            stack = ';'.join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def folded(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]))
+
+
+def save(profiler, request_info, query_log=None):
+    """Store a finished profile with the request's SQL timings; returns its id"""
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid4().hex[:8]}"
+    artifact = dict(request_info)
+    artifact.update({
+        'id': profile_id,
+        'seconds': round(profiler.seconds, 6),
+        'interval': profiler.interval,
+        'samples': profiler.samples,
+        'stacks': profiler.folded(),
+        'sql': None,
+    })
+    if query_log is not None:
+        artifact['sql'] = {
+            'count': query_log.count,
+            'seconds': round(query_log.seconds, 6),
+            'statements': [{'shape': shape, 'seconds': round(seconds, 6), 'rows': rows}
+                           for shape, seconds, rows in query_log.statements],
+            'repeated': {shape: times for shape, (times, _, _) in query_log.repeated().items()},
+        }
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=PROFILE_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(artifact, f)
+    os.replace(tmp_path, os.path.join(PROFILE_DIR, f'{profile_id}.json'))
+    _prune()
+    return profile_id
+
+
+def _stored():
+    """Paths of the stored profiles, oldest first"""
+    paths = []
+    for path in glob.glob(os.path.join(PROFILE_DIR, '*.json')):
+        try:
+            paths.append((os.path.getmtime(path), path))
+        except OSError:
+            continue
+    return [path for _, path in sorted(paths)]
+
+
+def _prune():
+    paths = _stored()
+    for path in paths[:-PROFILE_KEEP]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first"""
+    profiles = []
+    for path in reversed(_stored()):
+        try:
+            with open(path) as f:
+                artifact = json.load(f)
+        except (OSError, ValueError):
+            continue
+        profiles.append({key: artifact.get(key) for key in ('id', 'method', 'path', 'endpoint', 'status', 'seconds', 'samples')})
+    return profiles
+
+
+def profile_path(profile_id):
+    """Path of a stored profile, or None; ids are checked so they cannot escape PROFILE_DIR"""
+    if not profile_id or os.path.basename(profile_id) != profile_id or profile_id.startswith('.'):
+        return None
+    path = os.path.join(PROFILE_DIR, f'{profile_id}.json')
+    return path if os.path.exists(path) else None
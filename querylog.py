@@ -0,0 +1,159 @@
+import contextvars
+import os
+import re
+import time
+from functools import lru_cache
+
+# Statements slower than this many seconds are printed with their row count
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_SECONDS', 0.5))
+# A request running one statement shape more often than this is flagged as N+1
+REPEATED_QUERY_LIMIT = int(os.environ.get('REPEATED_QUERY_LIMIT', 10))
+
+_current = contextvars.ContextVar('query_log', default=None)
+
+STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+REPEATED_GROUPS = re.compile(r'(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+')
+REPEATED_UNIONS = re.compile(r'((?:SELECT )?\(SELECT .*?\))(?: UNION \1)+')
+
+
+@lru_cache(maxsize=2048)
+def normalize(sql):
+    """Statement shape: literals and placeholders become ?, value lists become (...)"""
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    shape = STRING_LITERAL.sub('?', sql)
+    shape = shape.replace('%s', '?')
+    shape = NUMBER_LITERAL.sub('?', shape)
+    shape = ' '.join(shape.split())
+    shape = PLACEHOLDER_LIST.sub('(...)', shape)
+    shape = REPEATED_GROUPS.sub(r'\1', shape)
+    return REPEATED_UNIONS.sub(r'\1 UNION ...', shape)
+
+
+class QueryLog:
+    """Every statement one request ran: shape, time and rows"""
+
+    def __init__(self, label):
+        self.label = label
+        # [shape, seconds, rows] per statement, in the order they ran
+        self.statements = []
+
+    def add(self, shape, seconds, rows):
+        entry = [shape, seconds, rows]
+        self.statements.append(entry)
+        return entry
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def seconds(self):
+        return sum(entry[1] for entry in self.statements)
+
+    def shapes(self):
+        """shape -> [times run, total seconds, total rows], most run first"""
+        totals = {}
+        for shape, seconds, rows in self.statements:
+            total = totals.setdefault(shape, [0, 0.0, 0])
+            total[0] += 1
+            total[1] += seconds
+            total[2] += max(rows, 0)
+        return dict(sorted(totals.items(), key=lambda item: -item[1][0]))
+
+    def repeated(self, limit=REPEATED_QUERY_LIMIT):
+        """Shapes run more than limit times: the N+1 suspects"""
+        return {shape: total for shape, total in self.shapes().items() if total[0] > limit}
+
+    def slow(self, threshold=SLOW_QUERY_SECONDS):
+        return [entry for entry in self.statements if entry[1] >= threshold]
+
+
+def start(label):
+    """Collect the statements run by this thread's current request"""
+    log = QueryLog(label)
+    _current.set(log)
+    return log
+
+
+def finish():
+    """Stop collecting, report slow and repeated statements and return the log"""
+    log = _current.get()
+    _current.set(None)
+    if log is not None:
+        for shape, seconds, rows in log.slow():
+            print(f"Slow query on {log.label} ({seconds * 1000:.1f} ms, {rows} rows): {shape}")
+        for shape, (times, seconds, _) in log.repeated().items():
+            print(f"Repeated query on {log.label} ({times} times, {seconds * 1000:.1f} ms): {shape}")
+    return log
+
+
+def current():
+    return _current.get()
+
+
+class InstrumentedCursor:
+    """Cursor wrapper that times every statement and counts the rows it returned or changed"""
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._entry = None
+
+    def _record(self, sql, started):
+        seconds = time.perf_counter() - started
+        # Rows of a SELECT are counted as they are fetched
+        rows = 0 if getattr(self._raw, 'with_rows', False) else self._raw.rowcount
+        log = _current.get()
+        if log is not None:
+            self._entry = log.add(normalize(sql), seconds, rows)
+        else:
+            # Outside a request (jobs, CLI) there is no log to report it at the end
+            self._entry = None
+            if seconds >= SLOW_QUERY_SECONDS:
+                print(f"Slow query ({seconds * 1000:.1f} ms, {rows} rows): {normalize(sql)}")
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._raw.execute(operation, params, *args, **kwargs)
+        finally:
+            self._record(operation, started)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._raw.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            self._record(operation, started)
+
+    def _fetched(self, started, rows):
+        # Unbuffered cursors read rows on fetch, so that time belongs to the statement
+        if self._entry is not None:
+            self._entry[1] += time.perf_counter() - started
+            self._entry[2] += rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._raw.fetchone()
+        self._fetched(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        rows = self._raw.fetchmany(*args, **kwargs)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = self._raw.fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
@@ -2,6 +2,8 @@ import mysql.connector
 from mysql.connector import Error
 import os
 
+from migrations import migrate
+
 def setup_database():
     db_config = {
         'host': os.environ.get('DB_HOST', 'localhost'),
@@ -25,81 +27,9 @@ def setup_database():
             cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_config['database']}")
             print(f"Database '{db_config['database']}' created or already exists")
             
-            # Use the database
+            # Use the database and bring its schema up to date
             cursor.execute(f"USE {db_config['database']}")
-            
-            # Create tables
-            tables = [
-                """
-                CREATE TABLE IF NOT EXISTS students (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    faculty_code VARCHAR(10) NOT NULL,
-                    session_type VARCHAR(1) NOT NULL,
-                    numeric_id INT NOT NULL,
-                    student_id VARCHAR(20) GENERATED ALWAYS AS (CONCAT(faculty_code, '/', session_type, '/', LPAD(numeric_id, 3, '0'))) STORED UNIQUE,
-                    first_name VARCHAR(100) NOT NULL,
-                    last_name VARCHAR(100) NOT NULL,
-                    email VARCHAR(255) UNIQUE NOT NULL,
-                    password VARCHAR(255) NOT NULL,
-                    major VARCHAR(100),
-                    enrollment_year INT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-                """,
-                """
-                CREATE TABLE IF NOT EXISTS courses (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    course_code VARCHAR(20) UNIQUE NOT NULL,
-                    course_name VARCHAR(255) NOT NULL,
-                    instructor VARCHAR(100) NOT NULL,
-                    schedule_days VARCHAR(50) NOT NULL,
-                    schedule_time VARCHAR(50) NOT NULL,
-                    credits INT NOT NULL,
-                    max_capacity INT NOT NULL,
-                    current_enrollment INT DEFAULT 0,
-                    program VARCHAR(255),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-                """,
-                """
-                CREATE TABLE IF NOT EXISTS registrations (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    student_id INT NOT NULL,
-                    course_id INT NOT NULL,
-                    semester VARCHAR(50) NOT NULL,
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE,
-                    FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE,
-                    UNIQUE KEY unique_registration (student_id, course_id, semester)
-                )
-                """,
-                """
-                CREATE TABLE IF NOT EXISTS grades (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    student_id INT NOT NULL,
-                    course_id INT NOT NULL,
-                    grade VARCHAR(5) NOT NULL,
-                    semester VARCHAR(50) NOT NULL,
-                    academic_year VARCHAR(20) NOT NULL,
-                    assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE,
-                    FOREIGN KEY (course_id) REFERENCES courses(id) ON DELETE CASCADE
-                )
-                """,
-                """
-                CREATE TABLE IF NOT EXISTS announcements (
-                    id INT AUTO_INCREMENT PRIMARY KEY,
-                    title VARCHAR(255) NOT NULL,
-                    content TEXT NOT NULL,
-                    author VARCHAR(100) NOT NULL,
-                    is_important BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-                """
-            ]
-            
-            for table in tables:
-                cursor.execute(table)
+            migrate(connection)
             
             # Insert sample courses
             sample_courses = [
@@ -126,5 +56,5 @@ def setup_database():
             cursor.close()
             connection.close()
 
-if _name_ == "_main_":
+if __name__ == "__main__":
     setup_database()
@@ -0,0 +1,91 @@
+import csv
+import re
+
+from catalog import FACULTY_MAJORS
+
+# Columns a student import CSV must have, in the order they are inserted
+STUDENT_COLUMNS = ['university_id', 'faculty', 'first_name', 'last_name', 'email',
+                   'phone_number', 'password', 'major', 'enrollment_year']
+
+
+def validate_phone_number(phone):
+    """Validate phone number format"""
+    pattern = r'^\+?1?\d{9,15}$'
+    return re.match(pattern, phone) is not None
+
+
+def read_batches(lines, batch_size):
+    """Yield lists of (line number, row) from a CSV without reading it all into memory"""
+    reader = csv.DictReader(lines)
+    if reader.fieldnames is None:
+        raise ValueError('The CSV file is empty')
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    missing = [column for column in STUDENT_COLUMNS if column not in reader.fieldnames]
+    if missing:
+        raise ValueError(f"The CSV file is missing columns: {', '.join(missing)}")
+
+    batch = []
+    for row in reader:
+        batch.append((reader.line_num, row))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def clean_row(row):
+    """Normalize one CSV row into a student, raising ValueError if it is not valid"""
+    student = {column: (row.get(column) or '').strip() for column in STUDENT_COLUMNS}
+    empty = [column for column, value in student.items() if not value]
+    if empty:
+        raise ValueError(f"Missing {', '.join(empty)}")
+
+    student['university_id'] = student['university_id'].upper()
+    student['faculty'] = student['faculty'].upper()
+    student['email'] = student['email'].lower()
+    if student['faculty'] not in FACULTY_MAJORS:
+        raise ValueError(f"Unknown faculty {student['faculty']}")
+    if student['major'] not in FACULTY_MAJORS[student['faculty']]:
+        raise ValueError(f"{student['major']} is not a major of {student['faculty']}")
+    if '@' not in student['email']:
+        raise ValueError(f"Invalid email {student['email']}")
+    if not validate_phone_number(student['phone_number']):
+        raise ValueError(f"Invalid phone number {student['phone_number']}")
+    if len(student['password']) < 6:
+        raise ValueError('Password must be at least 6 characters')
+    if not student['enrollment_year'].isdigit() or not 2000 <= int(student['enrollment_year']) <= 2100:
+        raise ValueError(f"Invalid enrollment year {student['enrollment_year']}")
+    student['enrollment_year'] = int(student['enrollment_year'])
+    return student
+
+
+def split_duplicates(cursor, students):
+    """Separate (line, student) pairs into new ones and (line, error) for duplicates.
+
+    Checks the whole batch against the students table in one query, and
+    against earlier rows of the same batch.
+    """
+    placeholders = ', '.join(['%s'] * len(students))
+    cursor.execute(
+        f"SELECT university_id, email FROM students WHERE university_id IN ({placeholders}) OR email IN ({placeholders})",
+        [student['university_id'] for _, student in students] + [student['email'] for _, student in students]
+    )
+    taken_ids = set()
+    taken_emails = set()
+    for university_id, email in cursor.fetchall():
+        taken_ids.add(university_id.upper())
+        taken_emails.add(email.lower())
+
+    fresh = []
+    errors = []
+    for line, student in students:
+        if student['university_id'] in taken_ids:
+            errors.append((line, f"University ID {student['university_id']} is already registered"))
+        elif student['email'] in taken_emails:
+            errors.append((line, f"Email {student['email']} is already registered"))
+        else:
+            fresh.append((line, student))
+            taken_ids.add(student['university_id'])
+            taken_emails.add(student['email'])
+    return fresh, errors
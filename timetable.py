@@ -0,0 +1,268 @@
+import re
+import threading
+from collections import namedtuple
+from datetime import time as clock
+
+DAY_NAMES = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+DAY_ALIASES = {
+    'm': 0, 'mo': 0, 'mon': 0, 'monday': 0,
+    't': 1, 'tu': 1, 'tue': 1, 'tues': 1, 'tuesday': 1,
+    'w': 2, 'we': 2, 'wed': 2, 'wednesday': 2,
+    'r': 3, 'th': 3, 'thu': 3, 'thur': 3, 'thurs': 3, 'thursday': 3,
+    'f': 4, 'fr': 4, 'fri': 4, 'friday': 4,
+    's': 5, 'sa': 5, 'sat': 5, 'saturday': 5,
+    'u': 6, 'su': 6, 'sun': 6, 'sunday': 6,
+}
+
+TIME_PATTERN = re.compile(r'(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?', re.IGNORECASE)
+
+# One weekly meeting of a course, in minutes after midnight
+Slot = namedtuple('Slot', 'day start end')
+
+# Bitmaps split the week into 5-minute cells, one bit each
+SLOT_MINUTES = 5
+CELLS_PER_DAY = 24 * 60 // SLOT_MINUTES
+# Students whose schedule bitmaps are kept in memory before the cache is cleared
+STUDENT_CACHE_LIMIT = 10000
+
+
+def parse_days(text):
+    """Turn 'Mon, Wed', 'Tue/Thu' or 'MWF' into sorted weekday numbers (Monday is 0)"""
+    days = set()
+    for token in re.split(r'[\s,/&;+]+|\band\b', (text or '').lower()):
+        token = token.strip('.')
+        if not token:
+            continue
+        if token in DAY_ALIASES:
+            days.add(DAY_ALIASES[token])
+            continue
+        # Compact forms such as 'mwf' or 'tth'
+        pieces = re.findall(r'th|su|sa|[mtwrfsu]', token)
+        if ''.join(pieces) == token:
+            days.update(DAY_ALIASES[piece] for piece in pieces)
+    return sorted(days)
+
+
+def _minutes(match, meridiem=None):
+    hour = int(match.group(1))
+    minute = int(match.group(2) or 0)
+    meridiem = (match.group(3) or meridiem or '').lower().replace('.', '')
+    if meridiem == 'pm' and hour < 12:
+        hour += 12
+    elif meridiem == 'am' and hour == 12:
+        hour = 0
+    return hour * 60 + minute
+
+
+def parse_time_range(text):
+    """Turn '10:00-11:30' or '1:30 PM - 3:00 PM' into (start, end) minutes, or None"""
+    parts = re.split(r'\s*(?:-|–|to)\s*', (text or '').strip(), maxsplit=1)
+    if len(parts) != 2:
+        return None
+    start_match = TIME_PATTERN.fullmatch(parts[0].strip())
+    end_match = TIME_PATTERN.fullmatch(parts[1].strip())
+    if not start_match or not end_match:
+        return None
+    # '1:30-3:00 PM' means both ends are PM
+    end = _minutes(end_match)
+    start = _minutes(start_match, end_match.group(3) if not start_match.group(3) else None)
+    if start >= end or end > 24 * 60:
+        return None
+    return start, end
+
+
+def parse_schedule(schedule_days, schedule_time):
+    """All weekly slots for a course's schedule columns; empty if they cannot be parsed"""
+    time_range = parse_time_range(schedule_time)
+    if not time_range:
+        return ()
+    return tuple(Slot(day, *time_range) for day in parse_days(schedule_days))
+
+
+def slots_bitmap(slots):
+    """Set one bit for every 5-minute cell of the week that the slots cover"""
+    bitmap = 0
+    for slot in slots:
+        first = slot.day * CELLS_PER_DAY + slot.start // SLOT_MINUTES
+        last = slot.day * CELLS_PER_DAY + -(-slot.end // SLOT_MINUTES)
+        bitmap |= ((1 << (last - first)) - 1) << first
+    return bitmap
+
+
+# course_id -> ((schedule_days, schedule_time), slots, bitmap)
+_course_cache = {}
+# student_id -> {course_id: bitmap, ...} and the union of those bitmaps
+_student_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _course_entry(course_id, schedule_days, schedule_time):
+    key = (schedule_days, schedule_time)
+    cached = _course_cache.get(course_id)
+    if cached and cached[0] == key:
+        return cached
+    slots = parse_schedule(schedule_days, schedule_time)
+    entry = (key, slots, slots_bitmap(slots))
+    with _cache_lock:
+        _course_cache[course_id] = entry
+    return entry
+
+
+def course_slots(course_id, schedule_days, schedule_time):
+    """Parsed slots for a course, cached per course and re-parsed if its schedule changes"""
+    return _course_entry(course_id, schedule_days, schedule_time)[1]
+
+
+def course_bitmap(course_id, schedule_days, schedule_time):
+    """Weekly occupancy bitmap for a course, cached alongside its slots"""
+    return _course_entry(course_id, schedule_days, schedule_time)[2]
+
+
+def forget_course(course_id):
+    """Drop a deleted course from the course cache and every cached student schedule"""
+    with _cache_lock:
+        _course_cache.pop(course_id, None)
+        for student in _student_cache.values():
+            if student['courses'].pop(course_id, None) is not None:
+                student['union'] = _union(student['courses'])
+
+
+def _union(bitmaps):
+    union = 0
+    for bitmap in bitmaps.values():
+        union |= bitmap
+    return union
+
+
+def _load_course_bitmaps(cursor, course_ids):
+    """Bitmaps for the given courses, reading schedules only for courses not cached yet"""
+    bitmaps = {}
+    missing = []
+    for course_id in course_ids:
+        cached = _course_cache.get(course_id)
+        if cached:
+            bitmaps[course_id] = cached[2]
+        else:
+            missing.append(course_id)
+    if missing:
+        cursor.execute(
+            f"SELECT id, schedule_days, schedule_time FROM courses WHERE id IN ({', '.join(['%s'] * len(missing))})",
+            missing
+        )
+        for course_id, schedule_days, schedule_time in cursor.fetchall():
+            bitmaps[course_id] = course_bitmap(course_id, schedule_days, schedule_time)
+    return bitmaps
+
+
+def student_schedule(cursor, student_id, semester):
+    """The student's cached per-course bitmaps for semester and their union.
+
+    The registered course ids are re-read on every call (an index lookup),
+    so registrations made through another worker are noticed; the cached
+    union is only rebuilt when that set has changed.
+    """
+    cursor.execute("SELECT course_id FROM registrations WHERE student_id = %s AND semester = %s", (student_id, semester))
+    course_ids = {row[0] for row in cursor.fetchall()}
+
+    cached = _student_cache.get(student_id)
+    if cached and cached['semester'] == semester and cached['courses'].keys() == course_ids:
+        return cached
+
+    entry = {'semester': semester, 'courses': _load_course_bitmaps(cursor, course_ids)}
+    entry['union'] = _union(entry['courses'])
+    with _cache_lock:
+        if len(_student_cache) >= STUDENT_CACHE_LIMIT:
+            _student_cache.clear()
+        _student_cache[student_id] = entry
+    return entry
+
+
+def find_conflict(cursor, student_id, course_id, semester):
+    """Id of a course the student is registered for in semester that overlaps course_id, or None"""
+    target = _load_course_bitmaps(cursor, [course_id]).get(course_id, 0)
+    schedule = student_schedule(cursor, student_id, semester)
+    if not target & schedule['union']:
+        return None
+    for other_id, bitmap in schedule['courses'].items():
+        if other_id != course_id and bitmap & target:
+            return other_id
+    return None
+
+
+def note_registration(student_id, course_id):
+    """Add a new registration to the student's cached schedule"""
+    with _cache_lock:
+        student = _student_cache.get(student_id)
+        cached = _course_cache.get(course_id)
+        if student is not None and cached:
+            student['courses'][course_id] = cached[2]
+            student['union'] |= cached[2]
+
+
+def note_drop(student_id, course_id):
+    """Remove a dropped course from the student's cached schedule"""
+    with _cache_lock:
+        student = _student_cache.get(student_id)
+        if student is not None and student['courses'].pop(course_id, None) is not None:
+            student['union'] = _union(student['courses'])
+
+
+def format_minutes(minutes):
+    return clock(minutes // 60, minutes % 60).strftime('%I:%M %p').lstrip('0')
+
+
+class Week:
+    """A student's classes bucketed by weekday"""
+
+    def __init__(self, courses):
+        self.courses = courses
+        self.days = [[] for _ in DAY_NAMES]
+        self.unscheduled = []
+        for course in courses:
+            slots = course_slots(course['id'], course['schedule_days'], course['schedule_time'])
+            if not slots:
+                self.unscheduled.append(course)
+            for slot in slots:
+                self.days[slot.day].append({
+                    'day': DAY_NAMES[slot.day],
+                    'start': slot.start,
+                    'end': slot.end,
+                    'start_time': clock(slot.start // 60, slot.start % 60),
+                    'end_time': clock(slot.end // 60, slot.end % 60),
+                    'time': f"{format_minutes(slot.start)} - {format_minutes(slot.end)}",
+                    'course_code': course['course_code'],
+                    'course_name': course['course_name'],
+                    'instructor': course['instructor'],
+                    'room': course.get('room') or 'TBA',
+                })
+        for entries in self.days:
+            entries.sort(key=lambda entry: entry['start'])
+
+    def on(self, weekday):
+        """Classes on a weekday (Monday is 0), in start order"""
+        return self.days[weekday]
+
+    @property
+    def entries(self):
+        return [entry for entries in self.days for entry in entries]
+
+    @property
+    def credits(self):
+        return sum(course['credits'] or 0 for course in self.courses)
+
+    @property
+    def study_days(self):
+        return sum(1 for entries in self.days if entries)
+
+
+def student_week(cursor, student_id, semester):
+    """Assemble a student's week from their registrations for semester in one query"""
+    cursor.execute("""
+        SELECT c.id, c.course_code, c.course_name, c.instructor, c.schedule_days, c.schedule_time, c.credits
+        FROM registrations r
+        JOIN courses c ON c.id = r.course_id
+        WHERE r.student_id = %s AND r.semester = %s
+        ORDER BY c.course_code
+    """, (student_id, semester))
+    return Week(cursor.fetchall())
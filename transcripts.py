@@ -0,0 +1,170 @@
+import glob
+import hashlib
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from gpa import student_summary, term_order
+
+# Rendered transcripts; must be shared if workers run on several hosts
+TRANSCRIPT_DIR = os.environ.get('TRANSCRIPT_DIR', os.path.join(tempfile.gettempdir(), 'transcripts'))
+# Processes used to pre-generate a cohort's transcripts
+TRANSCRIPT_PROCESSES = int(os.environ.get('TRANSCRIPT_PROCESSES', os.cpu_count() or 1))
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+TEMPLATE_NAME = 'transcript.html'
+
+# Rendered outside Flask so the batch job's worker processes need nothing but this module
+_env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(['html']))
+
+STUDENT_FIELDS = "id, university_id, first_name, last_name, faculty, major, enrollment_year, grades_version"
+GRADE_FIELDS = """
+    SELECT g.student_id, c.course_code, c.course_name, c.credits, g.grade, g.semester, g.academic_year
+    FROM grades g
+    JOIN courses c ON c.id = g.course_id
+"""
+
+
+def grades_changed(cursor, student_ids):
+    """Move the students' transcripts to a new version; call with every grade write"""
+    student_ids = sorted(set(student_ids))
+    if student_ids:
+        cursor.execute(
+            f"UPDATE students SET grades_version = grades_version + 1 WHERE id IN ({', '.join(['%s'] * len(student_ids))})",
+            student_ids
+        )
+
+
+def transcript_key(student):
+    """Cache key: the student's grades version, the details printed on the transcript and the template"""
+    template_mtime = os.path.getmtime(os.path.join(TEMPLATE_DIR, TEMPLATE_NAME))
+    parts = (student['id'], student['grades_version'], student['university_id'], student['first_name'],
+             student['last_name'], student['faculty'], student['major'], template_mtime)
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def cached_path(student):
+    return os.path.join(TRANSCRIPT_DIR, f"{student['id']}-{transcript_key(student)}.html")
+
+
+def load_student(cursor, student_id):
+    cursor.execute(f"SELECT {STUDENT_FIELDS} FROM students WHERE id = %s", (student_id,))
+    return cursor.fetchone()
+
+
+def load_record(cursor, student):
+    """Everything a student's transcript prints"""
+    cursor.execute(
+        GRADE_FIELDS + f" WHERE g.student_id = %s ORDER BY g.academic_year, {term_order('g.semester')}, c.course_code",
+        (student['id'],)
+    )
+    grades = cursor.fetchall()
+    summary, terms = student_summary(cursor, student['id'])
+    return {'student': student, 'grades': grades, 'summary': summary, 'terms': terms}
+
+
+def load_cohort(cursor, enrollment_year, major=None):
+    """Records for a whole cohort in three queries, however many students it has"""
+    condition = "s.enrollment_year = %s"
+    params = [enrollment_year]
+    if major:
+        condition += " AND s.major = %s"
+        params.append(major)
+
+    cursor.execute(f"SELECT {STUDENT_FIELDS} FROM students s WHERE {condition}", params)
+    records = {student['id']: {'student': student, 'grades': [], 'summary': None, 'terms': []}
+               for student in cursor.fetchall()}
+    if not records:
+        return []
+
+    cursor.execute(
+        GRADE_FIELDS + f" JOIN students s ON s.id = g.student_id WHERE {condition}"
+        f" ORDER BY g.academic_year, {term_order('g.semester')}, c.course_code",
+        params
+    )
+    for grade in cursor.fetchall():
+        records[grade['student_id']]['grades'].append(grade)
+
+    cursor.execute(
+        f"SELECT t.student_id, t.academic_year, t.semester, t.credits_attempted, t.credits_earned, t.gpa"
+        f" FROM term_gpa t JOIN students s ON s.id = t.student_id WHERE {condition}"
+        f" ORDER BY t.academic_year DESC, {term_order('t.semester')} DESC",
+        params
+    )
+    for term in cursor.fetchall():
+        records[term['student_id']]['terms'].append(term)
+
+    cursor.execute(
+        f"SELECT t.student_id, t.credits_attempted, t.credits_earned, t.gpa"
+        f" FROM student_gpa t JOIN students s ON s.id = t.student_id WHERE {condition}",
+        params
+    )
+    for summary in cursor.fetchall():
+        records[summary['student_id']]['summary'] = summary
+    return list(records.values())
+
+
+def render_transcript(record):
+    """Printable HTML for one record, grades grouped by term, oldest term first"""
+    term_gpas = {(term['academic_year'], term['semester']): term for term in record['terms']}
+    terms = []
+    for grade in record['grades']:
+        key = (grade['academic_year'], grade['semester'])
+        if not terms or terms[-1]['key'] != key:
+            terms.append({'key': key, 'name': f"{grade['semester']} {grade['academic_year']}",
+                          'gpa': term_gpas.get(key), 'grades': []})
+        terms[-1]['grades'].append(grade)
+    return _env.get_template(TEMPLATE_NAME).render(
+        student=record['student'],
+        terms=terms,
+        summary=record['summary'],
+        issued_at=datetime.now(),
+    )
+
+
+def store(student, html):
+    """Write a transcript atomically and drop the student's older versions"""
+    os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
+    path = cached_path(student)
+    fd, tmp_path = tempfile.mkstemp(dir=TRANSCRIPT_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(html)
+    os.replace(tmp_path, path)
+    for old in glob.glob(os.path.join(TRANSCRIPT_DIR, f"{student['id']}-*.html")):
+        if old != path:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+    return path
+
+
+def transcript_path(cursor, student):
+    """Path of the student's current transcript, rendering it only on a cache miss"""
+    path = cached_path(student)
+    if not os.path.exists(path):
+        path = store(student, render_transcript(load_record(cursor, student)))
+    return path
+
+
+def _render_missing(records):
+    rendered = 0
+    for record in records:
+        if not os.path.exists(cached_path(record['student'])):
+            store(record['student'], render_transcript(record))
+            rendered += 1
+    return rendered
+
+
+def pregenerate(records, processes=TRANSCRIPT_PROCESSES):
+    """Render every record without a current transcript across a process pool; returns how many were rendered"""
+    if not records:
+        return 0
+    chunk = max(1, len(records) // (processes * 4))
+    chunks = [records[i:i + chunk] for i in range(0, len(records), chunk)]
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return sum(pool.map(_render_missing, chunks))